@@ -0,0 +1,8 @@
+module.exports = {
+  // the worker only needs coverage-final.json per request
+  istanbulReporter: ["json"],
+  // hooks are called as methods of the solidity-coverage API, this hands it to the worker (see hardhat_worker.js)
+  onServerReady: function () {
+    global.coverageApi = this;
+  },
+};
@@ -0,0 +1,132 @@
+import json
+import mmap
+import os
+from pathlib import Path
+
+# Coverage as bitsets: every statement, branch arm and line of the instrumented contracts gets a bit, the coverage
+# of a test is a Python int with the bits of what it hit. Union, intersection and difference are |, & and & ~ on
+# ints and popcount is int.bit_count(), all of them run in C over the whole bitset at once.
+
+
+def new_coverage_index() -> dict:
+    """Bit positions of the coverage items, shared by every test of a run so their bitsets can be combined."""
+    return {"items": [], "positions": {}}
+
+
+def index_item(index: dict, item: tuple) -> int:
+    position = index["positions"].get(item)
+    if position is None:
+        position = index["positions"][item] = len(index["items"])
+        index["items"].append(item)
+    return position
+
+
+def add_to_index(index: dict, coverage: dict):
+    """
+    Give every statement, branch arm and line in the maps of a coverage-final.json content a bit, also the ones
+    that weren't hit. Contracts are added in sorted order, so the positions don't depend on the order of the dict.
+    """
+    for coverage_key in sorted(coverage):
+        metrics = coverage[coverage_key]
+        contract = os.path.basename(coverage_key)
+        for key in metrics.get("statementMap", metrics.get("s", {})):
+            index_item(index, ("s", contract, key))
+        for key, branch in metrics.get("branchMap", {}).items():
+            for arm in range(len(branch.get("locations", metrics.get("b", {}).get(key, [])))):
+                index_item(index, ("b", contract, key, arm))
+        for key in metrics.get("l", {}):
+            index_item(index, ("l", contract, key))
+
+
+def coverage_bits(coverage: dict, index: dict) -> int:
+    """Bitset of what a coverage-final.json content hit, items that aren't in the index yet are added."""
+    bits = 0
+    for coverage_key, metrics in coverage.items():
+        contract = os.path.basename(coverage_key)
+        for key, hits in metrics.get("s", {}).items():
+            if hits > 0:
+                bits |= 1 << index_item(index, ("s", contract, key))
+        for key, hits in metrics.get("b", {}).items():
+            for arm, arm_hits in enumerate(hits):
+                if arm_hits > 0:
+                    bits |= 1 << index_item(index, ("b", contract, key, arm))
+        for key, hits in metrics.get("l", {}).items():
+            if hits > 0:
+                bits |= 1 << index_item(index, ("l", contract, key))
+    return bits
+
+
+def union(bitsets) -> int:
+    bits = 0
+    for other in bitsets:
+        bits |= other
+    return bits
+
+
+def difference(bits: int, other: int) -> int:
+    """What bits covers and other doesn't."""
+    return bits & ~other
+
+
+def count(bits: int) -> int:
+    return bits.bit_count()
+
+
+def covered_items(bits: int, index: dict) -> list:
+    items = []
+    while bits:
+        lowest = bits & -bits
+        items.append(index["items"][lowest.bit_length() - 1])
+        bits ^= lowest
+    return items
+
+
+def save_bitsets(path: Path, bitsets: dict, index: dict, rows: dict = None):
+    """
+    Store bitsets as fixed-width rows of little-endian bytes in path, with the row names and the index in a JSON
+    next to it. A test costs one bit per item instead of a dict of hit counts, and a row can be read without
+    loading the others (see load_bitsets).
+    :param rows: row name -> small dict stored with the row, e.g. the state and duration of the test
+    """
+    row_bytes = (len(index["items"]) + 7) // 8
+    names = list(bitsets)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        for name in names:
+            f.write(bitsets[name].to_bytes(row_bytes, "little"))
+    os.replace(tmp_path, path)
+
+    meta_path = path.with_name(path.name + ".json")
+    tmp_path = meta_path.with_name(meta_path.name + ".tmp")
+    tmp_path.write_text(json.dumps({"row_bytes": row_bytes, "names": names, "items": index["items"],
+                                    "rows": rows or {}}), encoding="utf-8")
+    os.replace(tmp_path, meta_path)
+
+
+def load_index(path: Path) -> dict:
+    with open(path.with_name(path.name + ".json"), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    items = [tuple(item) for item in meta["items"]]
+    return {"items": items, "positions": {item: position for position, item in enumerate(items)},
+            "row_bytes": meta["row_bytes"], "names": meta["names"], "rows": meta.get("rows", {})}
+
+
+def load_bitsets(path: Path, names: list = None) -> tuple:
+    """
+    Read the bitsets of save_bitsets, the file is memory-mapped so only the requested rows are read.
+    :param names: rows to read, all of them when None
+    :return: dict name -> bitset and the index
+    """
+    index = load_index(path)
+    row_bytes = index["row_bytes"]
+    rows = {name: row for row, name in enumerate(index["names"])}
+    names = index["names"] if names is None else names
+
+    bitsets = {}
+    if row_bytes == 0 or not rows:
+        return {name: 0 for name in names}, index
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        for name in names:
+            start = rows[name] * row_bytes
+            bitsets[name] = int.from_bytes(mapped[start:start + row_bytes], "little")
+    return bitsets, index
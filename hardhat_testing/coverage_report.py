@@ -0,0 +1,60 @@
+import json
+import os
+
+
+def parse_contract_coverage(metrics: dict) -> dict:
+    """
+    Turn the coverage-final.json entry of a single contract into hit structures per statement, line, function and
+    branch. The hit counts are kept, so fitness can be computed on any of them and not only on the percentages.
+    """
+    function_hits = metrics.get("f", {})
+    branch_hits = metrics.get("b", {})
+    return {
+        "path": metrics.get("path"),
+        "statements": {int(key): hits for key, hits in metrics.get("s", {}).items()},
+        "lines": {int(line): hits for line, hits in metrics.get("l", {}).items()},
+        "functions": {int(key): {"name": function["name"], "line": function["line"],
+                                 "hits": function_hits.get(key, 0)}
+                      for key, function in metrics.get("fnMap", {}).items()},
+        "branches": {int(key): {"line": branch["line"], "type": branch["type"],
+                                "hits": list(branch_hits.get(key, []))}
+                     for key, branch in metrics.get("branchMap", {}).items()},
+    }
+
+
+def index_coverage(data: dict) -> dict:
+    """
+    Index the content of a coverage-final.json by contract.
+    :return: dict that maps the contract file name ('2018-11429.sol') on its hit structures
+    """
+    return {os.path.basename(file_path): parse_contract_coverage(metrics) for file_path, metrics in data.items()}
+
+
+def load_coverage(coverage_path) -> dict:
+    """Read a coverage-final.json (or the coverage.json next to the Hardhat config, it has the same content) once."""
+    with open(coverage_path, "r", encoding="utf-8") as f:
+        return index_coverage(json.load(f))
+
+
+def calc_coverage(hits: list) -> float:
+    """Same calculation as excel_code/toExcel.py: percentage of the items that were hit at least once."""
+    if len(hits) == 0:
+        return 100.0  # Assume full coverage if nothing to measure
+    covered = sum(1 for hit in hits if hit > 0)
+    return round((covered / len(hits)) * 100, 2)
+
+
+def coverage_percentages(contract_coverage: dict) -> dict:
+    """Percentages of a contract with the same keys as the Hardhat coverage table (see get_coverages)."""
+    return {
+        "% Stmts": calc_coverage(list(contract_coverage["statements"].values())),
+        "% Branch": calc_coverage([hit for branch in contract_coverage["branches"].values()
+                                   for hit in branch["hits"]]),
+        "% Funcs": calc_coverage([function["hits"] for function in contract_coverage["functions"].values()]),
+        "% Lines": calc_coverage(list(contract_coverage["lines"].values())),
+    }
+
+
+def get_coverages(coverage: dict, filenames: list) -> dict:
+    """Coverage percentages of the given contracts, the structured replacement of scraping the console table."""
+    return {filename: coverage_percentages(coverage[filename]) for filename in filenames if filename in coverage}
@@ -1,7 +1,9 @@
 import os
-import re
+from pathlib import Path
 from pprint import pprint
 
+from test_rewriter import skip_failing_tests
+
 # Pad naar je testfolder
 test_folder = "test"
 
@@ -88,81 +90,68 @@ def find_failing_tests(output_file: str) -> list:
     return tests_to_skip
 
 
-def disable_tests(failing_tests: list, destination_filepath: str):
-    # Doorloop alle .js-bestanden in de map
-    current_test_idx = -1
-    for subfolder_name in os.listdir(test_folder):
-
-        current_test_folder = test_folder + "/" + subfolder_name
-
-        for js_test in os.listdir(current_test_folder):
-
-            if not js_test.endswith(".js"):
-                continue
-            else:
-                current_test_idx += 1
-
-            filepath = os.path.join(current_test_folder, js_test)
-
-            with open(filepath, "r", encoding="utf-8") as file:
-                content = file.read()
-
-            # Vervang `it("TEST x"` of `it('TEST x')` met `it.skip("TEST x")`
-            try:
-                # failsafe if test is empty
-                if 'it("test' not in content:
-                    current_test_idx -= 1  # test is skipped in output so idx shouldn't have increased
-                    continue
-
-                for test_number in failing_tests[current_test_idx]:
-                    test_name = "test " + str(test_number)
-                    pattern = re.compile(rf'\bit\(["\']{re.escape(test_name)}["\']')
-                    content = pattern.sub(f'it.skip("{test_name}"', content)
-
-                write_filepath = os.path.join(destination_filepath, js_test)
-                with open(write_filepath, "w", encoding="utf-8") as file:
-                    file.write(content)
-            except IndexError:
-                print(f'LOGGER: Index our of range for: {js_test}')
-                break
-
-
-def disable_tests_same_folder(failing_tests: list, destination_filepath: str, current_test_folder: str):
-    # Doorloop alle .js-bestanden in de map
-    current_test_idx = -1
-
+def match_positions(failing_tests, current_test_folder: str) -> dict:
+    """
+    Map the lists of find_failing_tests on the test files of a folder, in the order Hardhat ran them.
+    :param failing_tests: iterator over the lists, the folders of a run share it
+    :return: failing test numbers per file name
+    """
+    failing_per_file = {}
     for js_test in os.listdir(current_test_folder):
-
         if not js_test.endswith(".js"):
             continue
-        else:
-            current_test_idx += 1
-
-        filepath = os.path.join(current_test_folder, js_test)
 
-        with open(filepath, "r", encoding="utf-8") as file:
-            content = file.read()
-
-        # Vervang `it("TEST x"` of `it('TEST x')` met `it.skip("TEST x")`
-        try:
-            # failsafe if test is empty
-            if 'it("test' not in content:
-                current_test_idx -= 1  # test is skipped in output so idx shouldn't have increased
+        with open(os.path.join(current_test_folder, js_test), "r", encoding="utf-8") as file:
+            # failsafe if test is empty, it is skipped in the output
+            if 'it("test' not in file.read():
                 continue
 
-            for test_number in failing_tests[current_test_idx]:
-                test_name = "test " + str(test_number)
-                pattern = re.compile(rf'\bit\(["\']{re.escape(test_name)}["\']')
-                content = pattern.sub(f'it.skip("{test_name}"', content)
-
-            write_filepath = os.path.join(destination_filepath, js_test)
-            with open(write_filepath, "w", encoding="utf-8") as file:
-                file.write(content)
-        except IndexError:
+        tests = next(failing_tests, None)
+        if tests is None:
             print(f'LOGGER: Index our of range for: {js_test}')
             break
+        failing_per_file[js_test] = tests
+    return failing_per_file
 
 
-# find_failing_tests("full_output_rs.txt")
-# disable_tests(find_failing_tests("claude_3_7_full_best.txt"), "test/claude_3_7_full_best")
-disable_tests_same_folder(find_failing_tests("hybrid_llm_then_search_gen2.txt"), "test/genetic_search/success_generation2", "test/genetic_search/generation2")
+def disable_tests(failing_tests: list, destination_filepath: str):
+    # Doorloop alle .js-bestanden in de map
+    failing_tests = iter(failing_tests)
+    for subfolder_name in os.listdir(test_folder):
+        current_test_folder = test_folder + "/" + subfolder_name
+        skip_failing_tests(match_positions(failing_tests, current_test_folder),
+                           Path(current_test_folder), Path(destination_filepath))
+
+
+def disable_tests_same_folder(failing_tests, destination_filepath: str, current_test_folder: str,
+                              manifest_path=None):
+    """
+    Write the tests of current_test_folder to destination_filepath with their failing tests skipped.
+    :param failing_tests: failing test numbers per test file name (see test_results.failing_tests_by_file), or the
+                          list of find_failing_tests, which is mapped on the files by their position in the folder
+    :param manifest_path: where to write which tests were skipped per file, see test_rewriter.skip_failing_tests
+    """
+    if isinstance(failing_tests, dict):
+        for js_test in sorted(os.listdir(current_test_folder)):
+            if js_test.endswith(".js") and js_test not in failing_tests:
+                print(f'LOGGER: no test results for: {js_test}')
+        failing_tests = {js_test: tests for js_test, tests in failing_tests.items()
+                         if os.path.exists(os.path.join(current_test_folder, js_test))}
+    else:
+        failing_tests = match_positions(iter(failing_tests), current_test_folder)
+
+    skip_failing_tests(failing_tests, Path(current_test_folder), Path(destination_filepath),
+                       manifest_path=manifest_path)
+
+
+def skip_tests_in_place(filepath: str, test_numbers: list) -> bool:
+    """Skip the tests in the file itself, the file is only written when something changed. :return: if it changed"""
+    filepath = Path(filepath)
+    manifest = skip_failing_tests({filepath.name: test_numbers}, filepath.parent)
+    return manifest["files"][filepath.name]["written"]
+
+
+if __name__ == "__main__":
+    # find_failing_tests("full_output_rs.txt")
+    # disable_tests(find_failing_tests("claude_3_7_full_best.txt"), "test/claude_3_7_full_best")
+    disable_tests_same_folder(find_failing_tests("hybrid_llm_then_search_gen2.txt"), "test/genetic_search/success_generation2", "test/genetic_search/generation2")
@@ -0,0 +1,47 @@
+import hashlib
+import json
+from pathlib import Path
+
+HARDHAT_DIR = Path(__file__).parent
+CACHE_DIR = HARDHAT_DIR / "evaluation_cache"
+
+
+def evaluation_key(contract, test_files: list, config_path: Path = HARDHAT_DIR / "hardhat.config.js",
+                   test_dir: Path = None) -> str:
+    """
+    Content hash of everything that decides the result of running the tests of a contract: the compiler settings
+    in the Hardhat config, the contract source and the name and content of every test file.
+    :param contract: Path of the contract, None for tests that run against all contracts
+    :param test_dir: hash the paths of the test files relative to this folder instead of their names
+    """
+    digest = hashlib.sha256()
+    digest.update(config_path.read_bytes())
+    if contract is not None:
+        digest.update(contract.name.encode("utf-8"))
+        digest.update(contract.read_bytes())
+    def test_name(test_file):
+        return test_file.relative_to(test_dir).as_posix() if test_dir else test_file.name
+
+    for test_file in sorted(test_files, key=test_name):
+        digest.update(test_name(test_file).encode("utf-8"))
+        digest.update(test_file.read_bytes())
+    return digest.hexdigest()
+
+
+def load_evaluation(key: str):
+    """Cached result of an evaluation, None if these inputs were never run before."""
+    cache_path = CACHE_DIR / f"{key}.json"
+    if not cache_path.exists():
+        return None
+    with open(cache_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def store_evaluation(key: str, result: dict):
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    cache_path = CACHE_DIR / f"{key}.json"
+    tmp_path = cache_path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+    # a crash while writing must not leave a half written result behind that is trusted on the next run
+    tmp_path.replace(cache_path)
@@ -0,0 +1,89 @@
+import math
+import random
+from itertools import combinations
+
+# full: every combination (2**k versions), pairwise: every pair of lines sees all 4 combinations,
+# random: at most EXPANSION_CAP random combinations. Every strategy starts with the first version of full and gives
+# the versions of full in its order when it doesn't make fewer of them, so the children come in the same order.
+EXPANSION_STRATEGIES = ["full", "pairwise", "random"]
+EXPANSION_CAP = 16
+
+
+def full_expansion_modes(num_lines: int):
+    """
+    The original expansion: a mode that flips every 'alternation' + 1 versions, doubles its alternation per line
+    and carries over from one line to the next. Computed per version so the 2**num_lines versions are never all
+    in memory.
+    """
+    n = 2 ** num_lines
+
+    start_modes = []
+    mode = True
+    alternation = 1
+    for _ in range(num_lines):
+        start_modes.append((mode, alternation))
+        # the mode flips once every alternation + 1 versions, n versions later it carries over to the next line
+        mode = mode != ((n // (alternation + 1)) % 2 == 1)
+        alternation *= 2
+
+    for j in range(n):
+        yield [start_mode != (((j + 1) // (alternation + 1)) % 2 == 1) for start_mode, alternation in start_modes]
+
+
+def pairwise_expansion_modes(num_lines: int):
+    """
+    Binary covering array of strength 2. Every line is a column of 'rows' bits that starts with 0 and has
+    ceil(rows / 2) ones: two such columns always have a (0, 0) row, never contain each other so they have a (0, 1)
+    and a (1, 0) row, and they overlap in at least one 1 so they have a (1, 1) row. 10 lines need 6 versions
+    instead of 1024.
+    """
+    rows = 2
+    while math.comb(rows - 1, (rows + 1) // 2) < num_lines:
+        rows += 1
+    if 2 ** num_lines <= rows:
+        yield from full_expansion_modes(num_lines)
+        return
+
+    columns = []
+    for ones in combinations(range(1, rows), (rows + 1) // 2):
+        columns.append(set(ones))
+        if len(columns) == num_lines:
+            break
+
+    # a line has the mode of the first version of full in the rows outside its column (row 0 is in none), flipping
+    # a column keeps every pair of lines covered
+    first = next(full_expansion_modes(num_lines))
+    for row in range(rows):
+        yield [first[line] != (row in column) for line, column in enumerate(columns)]
+
+
+def random_expansion_modes(num_lines: int, cap: int):
+    """At most cap different combinations drawn at random, all of them if there are no more than cap."""
+    if 2 ** num_lines <= cap:
+        yield from full_expansion_modes(num_lines)
+        return
+
+    # the first version of full first, the others at random
+    first = next(full_expansion_modes(num_lines))
+    seen = {sum(1 << line for line, mode in enumerate(first) if mode)}
+    yield first
+    while len(seen) < cap:
+        combination = random.getrandbits(num_lines)
+        if combination in seen:
+            continue
+        seen.add(combination)
+        yield [bool(combination >> line & 1) for line in range(num_lines)]
+
+
+def expansion_modes(num_lines: int, strategy: str = "full", cap: int = EXPANSION_CAP):
+    """
+    Yield per version of a mutated test which of its num_lines mutated lines keep their assertion (True) and which
+    get it updated by update_test_case_expectancy (False).
+    """
+    if strategy == "full":
+        return full_expansion_modes(num_lines)
+    elif strategy == "pairwise":
+        return pairwise_expansion_modes(num_lines)
+    elif strategy == "random":
+        return random_expansion_modes(num_lines, cap)
+    raise ValueError(f"unknown expansion strategy {strategy}, choose from {EXPANSION_STRATEGIES}")
@@ -0,0 +1,297 @@
+import random
+import shutil
+from pathlib import Path
+
+import coverage_report
+import genetic_search_amplifier as gsa
+from coverage_bitsets import new_coverage_index, coverage_bits
+from hardhat_worker_pool import start_worker_pool, run_on_pool, stop_worker_pool
+from mutation_scheduler import contract_entry, coverage_keys, reward_mutants, add_covered
+from pareto_selection import pareto_ranks
+from test_numbering import new_numbering
+
+HARDHAT_DIR = Path(__file__).parent
+
+# population size (at least the number of original tests), selection ('tournament', 'rank' or 'pareto'), how many
+# of the fittest tests survive unchanged and the chances a child is made by crossover and is mutated
+GA_CONFIG = {
+    "population_size": 20,
+    "generations": 5,
+    "selection": "tournament",
+    "tournament_size": 3,
+    "elitism": 2,
+    "crossover_rate": 0.6,
+    "mutation_rate": 0.8,
+}
+
+
+def mutate(test_case: dict, mutation_stats: dict = None) -> dict:
+    """
+    Mutation operator: make_smart_mutation on the input line of one of the correlations (any line with a literal
+    when the test has none), the correlated asserts follow the new value.
+    :param mutation_stats: stats of the mutation categories of the contract, see mutation_scheduler.py
+    :return: the mutated child, which knows the category of its mutation, the test case itself if it has nothing to
+             mutate
+    """
+    statements = test_case["statements"]
+    correlations = test_case["correlations"]
+    if correlations:
+        line_idx = random.choice(correlations)["input_line"]
+    else:
+        candidates = [idx for idx, spans in enumerate(test_case["literals"]) if spans]
+        if not candidates:
+            return test_case
+        line_idx = random.choice(candidates)
+
+    mutated_line, value, category = gsa.make_smart_mutation(statements[line_idx], mutation_stats)
+    new_statements = list(statements)
+    new_statements[line_idx] = mutated_line
+    if value is not None:
+        gsa.update_test_case_correlations(new_statements, line_idx, correlations, value, test_case["literals"])
+    return {**gsa.derive_test_case(test_case, new_statements), "mutation": category}
+
+
+def cross(parent1: dict, parent2: dict) -> dict:
+    """
+    Crossover operator: crossover on the first line (correlated input lines first) where both parents differ, so
+    only parents derived from the same original test can be crossed.
+    :return: one of the two children, parent1 itself when crossover isn't possible
+    """
+    statements1, statements2 = parent1["statements"], parent2["statements"]
+    if len(statements1) != len(statements2):
+        return parent1
+    input_lines = [correlation["input_line"] for correlation in parent1["correlations"]]
+    differing = [idx for idx in input_lines + list(range(len(statements1))) if statements1[idx] != statements2[idx]]
+    if not differing:
+        return parent1
+
+    line_idx = differing[0]
+    crossed = gsa.crossover(statements1[line_idx], statements2[line_idx])
+    if crossed is None or len(crossed) != 4:
+        return parent1
+    new_line, value = random.choice([(crossed[0], crossed[2]), (crossed[1], crossed[3])])
+
+    new_statements = list(statements1)
+    new_statements[line_idx] = new_line
+    gsa.update_test_case_correlations(new_statements, line_idx, parent1["correlations"], value, parent1["literals"])
+    return gsa.derive_test_case(parent1, new_statements)
+
+
+def tournament_selection(population: list, fitnesses: list, tournament_size: int) -> dict:
+    contenders = random.sample(range(len(population)), min(tournament_size, len(population)))
+    return population[max(contenders, key=lambda idx: fitnesses[idx])]
+
+
+def rank_selection(population: list, fitnesses: list) -> dict:
+    """The chance to be chosen is proportional to the rank, the least fit test has rank 1."""
+    ranked = sorted(range(len(population)), key=lambda idx: fitnesses[idx])
+    return population[random.choices(ranked, weights=range(1, len(ranked) + 1), k=1)[0]]
+
+
+def pareto_selection(population: list, fitnesses: list, tournament_size: int) -> dict:
+    """
+    Tournament on coverage against runtime: the contender on the best Pareto front of (fitness, -duration) wins,
+    the highest fitness on a tie. A slow test only wins when it covers more than the faster ones.
+    """
+    ranks = pareto_ranks([(fitness, -test_case.get("duration", 0))
+                          for test_case, fitness in zip(population, fitnesses)])
+    contenders = random.sample(range(len(population)), min(tournament_size, len(population)))
+    return population[min(contenders, key=lambda idx: (ranks[idx], -fitnesses[idx]))]
+
+
+def select(population: list, fitnesses: list, config: dict) -> dict:
+    if config["selection"] == "tournament":
+        return tournament_selection(population, fitnesses, config["tournament_size"])
+    if config["selection"] == "rank":
+        return rank_selection(population, fitnesses)
+    if config["selection"] == "pareto":
+        return pareto_selection(population, fitnesses, config["tournament_size"])
+    raise ValueError(f"unknown selection: {config['selection']}")
+
+
+def initial_population(test_cases: list, population_size: int, mutation_stats: dict = None) -> list:
+    """All original tests, filled up to the population size with mutants of them."""
+    population = list(test_cases)
+    while len(population) < population_size and test_cases:
+        population.append(mutate(random.choice(test_cases), mutation_stats))
+    return population
+
+
+def next_generation(population: list, fitnesses: list, config: dict, mutation_stats: dict = None) -> list:
+    """The elite survives as it is, the rest are children of selected parents."""
+    ranked = sorted(range(len(population)), key=lambda idx: fitnesses[idx], reverse=True)
+    new_population = [population[idx] for idx in ranked[:config["elitism"]]]
+
+    while len(new_population) < config["population_size"]:
+        child = select(population, fitnesses, config)
+        if random.random() < config["crossover_rate"]:
+            # a mate has to come from the same original test, the statements of other tests don't line up
+            mates = [idx for idx, test_case in enumerate(population)
+                     if test_case["origin"] == child["origin"] and test_case is not child]
+            if mates:
+                mate = select([population[idx] for idx in mates], [fitnesses[idx] for idx in mates], config)
+                child = cross(child, mate)
+        if random.random() < config["mutation_rate"]:
+            child = mutate(child, mutation_stats)
+        new_population.append(child)
+    return new_population
+
+
+def evolve(test_cases: list, evaluate, config: dict = None, mutation_stats: dict = None) -> tuple:
+    """
+    Evolve a population of tests of one test file.
+    :param test_cases: test case dicts of the original tests (see genetic_search_amplifier.parse_test_file)
+    :param evaluate: function(population) -> fitness per test case, see coverage_evaluator
+    :param config: overrides of GA_CONFIG, the population is made large enough for all original tests
+    :param mutation_stats: stats of the mutation categories of the contract, see mutation_scheduler.py
+    :return: the last population from fittest to least fit with its fitnesses, and the best and mean fitness of
+             every generation
+    """
+    config = {**GA_CONFIG, **(config or {})}
+    config["population_size"] = max(config["population_size"], len(test_cases))
+    population = initial_population(test_cases, config["population_size"], mutation_stats)
+    history = []
+
+    fitnesses = evaluate(population)
+    for generation in range(1, config["generations"] + 1):
+        history.append({"generation": generation - 1, "best": max(fitnesses, default=0),
+                        "mean": sum(fitnesses) / len(fitnesses) if fitnesses else 0})
+        population = next_generation(population, fitnesses, config, mutation_stats)
+        fitnesses = evaluate(population)
+    history.append({"generation": config["generations"], "best": max(fitnesses, default=0),
+                    "mean": sum(fitnesses) / len(fitnesses) if fitnesses else 0})
+
+    ranked = sorted(range(len(population)), key=lambda idx: fitnesses[idx], reverse=True)
+    return [population[idx] for idx in ranked], [fitnesses[idx] for idx in ranked], history
+
+
+def coverage_fitness(evaluation: dict) -> int:
+    """
+    Measured coverage of a test run on its own: the statements, branches and functions it hit. A test that fails
+    has no fitness, it would be skipped anyway.
+    """
+    if not evaluation["results"] or any(result["state"] == "failed" for result in evaluation["results"]):
+        return 0
+    fitness = 0
+    for contract_coverage in coverage_report.index_coverage(evaluation["coverage"]).values():
+        fitness += sum(1 for hits in contract_coverage["statements"].values() if hits > 0)
+        fitness += sum(1 for branch in contract_coverage["branches"].values() for hits in branch["hits"] if hits > 0)
+        fitness += sum(1 for function in contract_coverage["functions"].values() if function["hits"] > 0)
+    return fitness
+
+
+def coverage_evaluator(pool, work_dir: Path, original_test: str, test_name: str, scheduler: dict = None,
+                       originals: list = None):
+    """
+    Evaluate every test of a population in its own file on the Hardhat workers, so each gets its own coverage.
+    The fitness of tests that were evaluated before is remembered, the elite isn't run again. The duration of every
+    test in ms is stored in its test case dict, the pareto selection weighs it against the fitness.
+    :param scheduler: the categories of the new mutants are rewarded in it with their own coverage against the one
+                      of their original (see mutation_scheduler.reward_mutants), the contract is test_name
+    :param originals: test case dicts of the original tests, they have to be in the first population
+    """
+    known_fitness = {}
+    known_duration = {}
+    known_covered = {}
+    index = new_coverage_index()
+    original_keys = {test_case["origin"]: tuple(test_case["statements"]) for test_case in originals or []}
+
+    def evaluate(population: list) -> list:
+        work_dir.mkdir(parents=True, exist_ok=True)
+        new_tests = {}
+        new_test_cases = {}
+        for test_case in population:
+            key = tuple(test_case["statements"])
+            if key not in known_fitness and key not in new_tests:
+                test_file = work_dir / f"{test_name}-ga-{len(new_tests) + 1}.js"
+                test_file.write_text(gsa.assemble_full_generation([test_case], original_test=original_test,
+                                                                  scope=test_name), encoding="utf-8")
+                new_tests[key] = test_file
+                new_test_cases[key] = test_case
+
+        evaluations = run_on_pool(pool, [[test_file] for test_file in new_tests.values()])
+        for key, evaluation in zip(new_tests, evaluations):
+            known_fitness[key] = coverage_fitness(evaluation)
+            known_duration[key] = sum(result["duration"] or 0 for result in evaluation["results"])
+            known_covered[key] = coverage_keys(coverage_bits(evaluation["coverage"], index), index) \
+                if known_fitness[key] > 0 else set()
+        for test_file in new_tests.values():
+            test_file.unlink()
+
+        if scheduler is not None:
+            reward_mutants(scheduler, test_name, [
+                (test_case["mutation"], known_fitness[key] > 0, known_covered[key],
+                 known_covered.get(original_keys.get(test_case["origin"]), set()))
+                for key, test_case in new_test_cases.items() if test_case.get("mutation")])
+            add_covered(scheduler, test_name, set().union(*(known_covered[key] for key in new_tests)))
+        for test_case in population:
+            test_case["duration"] = known_duration[tuple(test_case["statements"])]
+        return [known_fitness[tuple(test_case["statements"])] for test_case in population]
+
+    return evaluate
+
+
+def evolve_test_file(test_file: Path, output_dir: Path, pool, config: dict = None, numbering=None,
+                     scheduler: dict = None) -> dict:
+    """
+    Evolve the tests of a test file and write the original tests and the tests of the last population with a
+    fitness as the amplified test file, so it never covers less than the tests it started from.
+    :param scheduler: learn the weights of the mutation categories in it, see mutation_scheduler.py
+    :return: the fitness history of the test file
+    """
+    test_name = test_file.stem.split('-amplified')[0]
+    current_test = test_file.read_text(encoding="utf-8")
+    test_cases = gsa.parse_test_file(current_test)
+    evaluate = coverage_evaluator(pool, output_dir / "ga_work", current_test, test_name, scheduler, test_cases)
+    mutation_stats = contract_entry(scheduler, test_name)["categories"] if scheduler is not None else None
+
+    population, fitnesses, history = evolve(test_cases, evaluate, config, mutation_stats)
+    original_statements = {tuple(test_case["statements"]) for test_case in test_cases}
+    # elites, parents that weren't changed and mutants without a literal leave copies of the same test, every test is
+    # written once, the population is sorted so the fittest copy is kept
+    survivors = {}
+    for test_case, fitness in zip(population, fitnesses):
+        key = tuple(test_case["statements"])
+        if fitness > 0 and key not in original_statements:
+            survivors.setdefault(key, test_case)
+
+    output_path = output_dir / f"{test_name}-amplified.js"
+    output_path.write_text(gsa.assemble_full_generation(test_cases, list(survivors.values()),
+                                                        original_test=current_test,
+                                                        numbering=numbering or new_numbering(), scope=test_name),
+                           encoding="utf-8")
+    return {"test": test_name, "fitness": fitnesses, "history": history}
+
+
+def evolve_test_files(input_dir: Path, output_dir: Path, workers=None, config: dict = None,
+                      scheduler: dict = None) -> dict:
+    """
+    Evolve every test file of input_dir into output_dir, the tests are evaluated on a pool of Hardhat workers.
+    :return: the result of evolve_test_file per test file
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    pool = start_worker_pool(workers)
+    try:
+        evolved = {}
+        for input_file in sorted(input_dir.glob("*.js")):
+            if input_file.stem in gsa.test_names_to_skip:
+                print("SKIPPING:", input_file.stem)
+                continue
+            result = evolve_test_file(input_file, output_dir, pool, config, scheduler=scheduler)
+            evolved[result["test"]] = result
+            print(f"LOGGER: {result['test']} best fitness per generation: "
+                  f"{[entry['best'] for entry in result['history']]}")
+        return evolved
+    finally:
+        stop_worker_pool(pool)
+        shutil.rmtree(output_dir / "ga_work", ignore_errors=True)
+
+
+INPUT_DIR = HARDHAT_DIR / "test/claude"
+OUTPUT_DIR = HARDHAT_DIR / "test/genetic_algorithm"
+SEED = 0
+NUM_WORKERS = None  # None uses all cores
+
+if __name__ == "__main__":
+    random.seed(SEED)
+    evolve_test_files(INPUT_DIR, OUTPUT_DIR, workers=NUM_WORKERS)
@@ -2,22 +2,37 @@ import copy
 import subprocess
 import random
 import re
+from decimal import Decimal
+from fractions import Fraction
 from typing import List, Tuple
 import time
 import os
 from pprint import pprint
 
+from expansion_strategies import full_expansion_modes
+from js_scanner import scan_blocks, block_body
+from mutation_scheduler import thompson_choice
+from profiling import stage
+from test_numbering import new_numbering, number_test
+
+# integers and floats inside a statement, shared by the mutation operator and the test case representation
+NUMBER_PATTERN = r'\b\d+\.\d+\b|\b\d+\b'
+
 
 def weighted_choice(prob):
     return random.random() < prob
 
 
-def run_hardhat_test():
-    """Run Hardhat tests and return the coverage report."""
-    result = subprocess.run(
-        ["wsl", "npx", "hardhat", "coverage"],
-        capture_output=True, text=True, encoding='utf-8'
-    )
+def run_hardhat_test(testfiles=None):
+    """Run Hardhat tests and return the coverage report. testfiles is an optional glob to only run those tests."""
+    command = ["wsl", "npx", "hardhat", "coverage"]
+    if testfiles is not None:
+        command += ["--testfiles", testfiles]
+    with stage("hardhat"):
+        result = subprocess.run(
+            command,
+            capture_output=True, text=True, encoding='utf-8'
+        )
     return result.stdout
 
 
@@ -38,58 +53,60 @@ def get_coverages(output, filenames: list) -> dict:
     return ret_dict
 
 
-def make_smart_mutation(test_case):
-    """Introduce smart mutations: edge cases, invalid inputs, boundary values."""
+# values of every mutation category as an inclusive range, with the weight the category is chosen with when there
+# are no stats of the contract yet (see mutation_scheduler.py)
+MUTATION_CATEGORIES = {
+    "valid": ((1, 100), 31),  # Random integer between 1 and 100
+    "negative": ((-100, -1), 12),  # Negative integer
+    "zero": ((0, 0), 19),  # Test edge case with zero
+    "large": ((1000000, 1000000000), 19),  # Large number
+    "boundary": ((2 ** 31 - 1, 2 ** 31 - 1), 19),  # Edge case for boundary of int32
+}
+
+
+def mutation_value(literal: str, stats: dict = None) -> tuple:
+    """
+    Draw a smart value for a numeric literal that is never the literal itself. Categories that only hold the
+    current value are left out and the value is drawn from the others without it, so this always takes one draw.
+    :param stats: category -> [successes, failures] of the contract, the category is chosen by Thompson sampling
+                  on them instead of with the fixed weights (see mutation_scheduler.py)
+    :return: the value and its category
+    """
+    current = int(literal) if literal.isdigit() and str(int(literal)) == literal else None
+
+    candidates = []
+    for category, ((low, high), weight) in MUTATION_CATEGORIES.items():
+        excluded = current is not None and low <= current <= high
+        if high - low + 1 - excluded > 0:
+            candidates.append((category, low, high, excluded, weight))
+
+    if stats:
+        chosen = candidates[thompson_choice([candidate[0] for candidate in candidates], stats)]
+    else:
+        chosen = random.choices(candidates, weights=[weight for *_, weight in candidates], k=1)[0]
+    category, low, high, excluded, _ = chosen
+    if not excluded:
+        return str(random.randint(low, high)), category
+    # skip over the current value: draw from one value less and shift the ones after it
+    value = random.randint(low, high - 1)
+    return str(value + 1 if value >= current else value), category
+
+
+def make_smart_mutation(test_case, stats: dict = None):
+    """
+    Introduce smart mutations: edge cases, invalid inputs, boundary values. Every numeric literal gets a value of
+    another category or another value of its own, so the line always changes when it has a literal.
+    :param stats: mutation stats of the contract, see mutation_value
+    :return: the mutated line, the value of its first literal and its category (both None without literals)
+    """
     mutated_values = []
 
     def replace_with_smart_value(match):
-        num_type = random.choice(["int", "int"])  # Randomly decide between int and float
-
-        value = None
-        if num_type == "int":
-            # Smart mutations for integers
-            # mutation_type = random.choice(["valid", "zero", "large", "boundary"])
-            # mutation_type = random.choice(["valid", "negative", "zero", "large", "boundary"])
-            mutation_type = random.choices(
-                ["valid", "negative", "zero", "large", "boundary"],
-                weights=[31, 12, 19, 19, 19],
-                k=1
-            )[0]
-
-            if mutation_type == "valid":
-                value = str(random.randint(1, 100))  # Random integer between 1 and 1000
-            elif mutation_type == "negative":
-                value = str(random.randint(-100, -1))  # Negative integer
-            elif mutation_type == "zero":
-                value = "0"  # Test edge case with zero
-            elif mutation_type == "large":
-                value = str(random.randint(1000000, 1000000000))  # Large number
-            elif mutation_type == "boundary":
-                value = str(random.choice([2 ** 31 - 1, 2 ** 31 - 1]))
-                # return str(random.choice([2 ** 31 - 1, -2 ** 31]))  # Edge case for boundary of int32
-        else:
-            # Smart mutations for floats
-            mutation_type = random.choice(["valid", "negative", "zero", "large", "boundary"])
-
-            if mutation_type == "valid":
-                value = str(round(random.uniform(1.0, 1000.0), 2))  # Valid float between 1.0 and 1000.0
-            elif mutation_type == "negative":
-                value = str(round(random.uniform(-1000.0, -1.0), 2))  # Negative float
-            elif mutation_type == "zero":
-                value = "0.0"  # Zero float
-            elif mutation_type == "large":
-                value = str(round(random.uniform(1000000.0, 1000000000.0), 2))  # Large float
-            elif mutation_type == "boundary":
-                value = str(
-                    random.choice([float('-inf'), float('inf'), float('nan')]))  # Boundary float values (NaN, Inf)
-        mutated_values.append(value)
-        return value
+        mutated_values.append(mutation_value(match.group(), stats))
+        return mutated_values[-1][0]
 
-    mutated_test = re.sub(r'\b\d+\.\d+\b|\b\d+\b', replace_with_smart_value, test_case)  # Match integers and floats
-    try:
-        return mutated_test, mutated_values[0]
-    except:
-        return mutated_test, None
+    mutated_test = re.sub(NUMBER_PATTERN, replace_with_smart_value, test_case)  # Match integers and floats
+    return (mutated_test, *mutated_values[0]) if mutated_values else (mutated_test, None, None)
 
 
 """
@@ -110,15 +127,17 @@ def generate_test_signature(test_case: list, test_name: str):
     return test_signature
 
 
-counter = 0
-
-
-def assemble_test_cases(all_tests: list):
+def assemble_test_cases(all_tests: list, numbering=None, scope: str = "", mutations: list = None):
+    """
+    :param all_tests: (origin, statements) tuples, origin is the original test it is derived from
+    :param numbering: numbering of the run (see test_numbering.py), a new one that starts at 'test 1' if None
+    :param scope: test file the tests are written to
+    :param mutations: mutation category per test (None when it isn't a mutant), recorded in the manifest
+    """
     full_test_file = ""
-    global counter
-    for test in all_tests:
-        counter += 1
-        test_name = f"test {counter}"
+    numbering = numbering or new_numbering()
+    for idx, (origin, test) in enumerate(all_tests):
+        test_name = number_test(numbering, scope, origin, mutation=mutations[idx] if mutations else None)
         full_test_file += generate_test_signature(test_case=test, test_name=test_name)
         full_test_file += '\n\n'
     return full_test_file
@@ -185,27 +204,46 @@ def update_test_case_expectancy(test_case: str):
             return 'expect(' + test_case + ').to.be.ok;'
 
 
-def update_test_case_correlations(full_test_case: list, updated_line_idx, correlations, value):
+def update_test_case_correlations(full_test_case: list, updated_line_idx, correlations, value, literals=None):
     """
     directly modify the test to update all values that depended on the mutated value
     :param full_test_case: processed representation of the test where the mutation occurred
     :param updated_line_idx: line index within the test where the mutation occurred
     :param correlations: all correlations that other values had to the mutated value
     :param value: value that was mutated
+    :param literals: numeric literal spans of the unmutated test (see build_test_case), avoids rescanning the lines
     :return: Nothing (the test is updated directly in this method and doesn't need to be returned)
     """
+    updated_lines = set()
     for correlation in correlations:
         # don't worry about lines that aren't updated
         if correlation['input_line'] != updated_line_idx:
             continue
 
         line_to_update = correlation['assert_line']
-        if correlation['relation'] == 'direct':
-            full_test_case[line_to_update] = re.sub(r'\b\d+\.\d+\b|\b\d+\b', value, full_test_case[line_to_update])
-        elif correlation['relation'] == 'sub_from_initial':
-            updated_value = str(correlation['initial_supply'] - int(value))
-            full_test_case[line_to_update] = re.sub(r'\b\d+\.\d+\b|\b\d+\b', updated_value,
-                                                    full_test_case[line_to_update])
+        updated_value = correlated_value(correlation, value)
+        if updated_value is None:
+            continue
+
+        # the spans are only valid as long as the line wasn't rewritten by an earlier correlation
+        if literals is not None and line_to_update not in updated_lines:
+            full_test_case[line_to_update] = replace_numeric_literals(full_test_case[line_to_update],
+                                                                      literals[line_to_update], updated_value)
+        else:
+            full_test_case[line_to_update] = re.sub(NUMBER_PATTERN, updated_value, full_test_case[line_to_update])
+        updated_lines.add(line_to_update)
+
+
+def replace_numeric_literals(line: str, spans: List[Tuple[int, int]], value: str) -> str:
+    """Replace every numeric literal of a line by value, using the spans that were found when the test was parsed."""
+    parts = []
+    last_end = 0
+    for start, end in spans:
+        parts.append(line[last_end:start])
+        parts.append(value)
+        last_end = end
+    parts.append(line[last_end:])
+    return "".join(parts)
 
 
 def extract_integers(js_line: str) -> List[str]:
@@ -309,29 +347,34 @@ def identify_mutated_line(original_test: list, mutated_test: list, correlations)
     return -1  # if no mutated line is found somehow, return -1 to show that tests are identical
 
 
-def genetic_search_amplification_crossover(original_test_cases: list, amplified_test_cases: list, correlations):
-    """Perform genetic search to amplify the test case."""
+def genetic_search_amplification_crossover(original_test_cases: list, amplified_test_cases: list):
+    """
+    Perform genetic search to amplify the test case.
+    :param original_test_cases: test case dicts of the original tests (see build_test_case)
+    :param amplified_test_cases: test case dicts returned by genetic_search_amplification_mutation
+    :return: list of test case dicts with the crossover children
+    """
 
     # Run the tests with Hardhat
     # base_output = run_hardhat_test()
     all_tests = []
-    ctr = -1
     amplified_idx_ctr = -1
-    for test_case in original_test_cases:
-        ctr += 1
+    for original_test_case in original_test_cases:
         amplified_idx_ctr += 1
-        if len(correlations[ctr]) == 0:
-            all_tests.append(test_case)
+        test_case = original_test_case["statements"]
+        correlations = original_test_case["correlations"]
+        if len(correlations) == 0:
+            all_tests.append(original_test_case)
             continue  # no correlations so no crossover can happen
 
         # increase it once more because if you are here, a mutation has happened previously due to a correlation
-        amplified_test1 = amplified_test_cases[amplified_idx_ctr]
+        amplified_test1 = amplified_test_cases[amplified_idx_ctr]["statements"]
         amplified_idx_ctr += 1
-        amplified_test2 = amplified_test_cases[amplified_idx_ctr]
+        amplified_test2 = amplified_test_cases[amplified_idx_ctr]["statements"]
 
         # find the index of the mutated line. This is needed because crossover without mutated lines is like
         # doing crossover with the same test twice so there is nothing to crossover on
-        mutated_line_idx = identify_mutated_line(test_case, amplified_test1, correlations[ctr])
+        mutated_line_idx = identify_mutated_line(test_case, amplified_test1, correlations)
 
         # perform crossover
         new_line1_1, new_line1_2, int1_1, int1_2 = crossover(test_case[mutated_line_idx],
@@ -340,28 +383,28 @@ def genetic_search_amplification_crossover(original_test_cases: list, amplified_
                                                              amplified_test2[mutated_line_idx])
 
         # update the new crossover lines with 4 new tests (crossover generates 2 lines per mutation)
+        literals = original_test_case["literals"]
         new_test_case1 = copy.deepcopy(test_case)
         new_test_case1[mutated_line_idx] = new_line1_1
-        update_test_case_correlations(new_test_case1, mutated_line_idx, correlations[ctr], int1_1)
+        update_test_case_correlations(new_test_case1, mutated_line_idx, correlations, int1_1, literals)
 
         new_test_case2 = copy.deepcopy(test_case)
         new_test_case2[mutated_line_idx] = new_line1_2
-        update_test_case_correlations(new_test_case2, mutated_line_idx, correlations[ctr], int1_2)
+        update_test_case_correlations(new_test_case2, mutated_line_idx, correlations, int1_2, literals)
 
         new_test_case3 = copy.deepcopy(test_case)
         new_test_case3[mutated_line_idx] = new_line2_1
-        update_test_case_correlations(new_test_case3, mutated_line_idx, correlations[ctr], int2_1)
+        update_test_case_correlations(new_test_case3, mutated_line_idx, correlations, int2_1, literals)
 
         new_test_case4 = copy.deepcopy(test_case)
         new_test_case4[mutated_line_idx] = new_line2_2
-        update_test_case_correlations(new_test_case4, mutated_line_idx, correlations[ctr], int2_2)
+        update_test_case_correlations(new_test_case4, mutated_line_idx, correlations, int2_2, literals)
 
         # add them to all tests
-        all_tests.extend([new_test_case1, new_test_case2, new_test_case3, new_test_case4])
+        all_tests.extend([derive_test_case(original_test_case, new_test_case)
+                          for new_test_case in [new_test_case1, new_test_case2, new_test_case3, new_test_case4]])
 
-    full_test = assemble_test_cases(all_tests)
-
-    return full_test
+    return all_tests
 
 
 """
@@ -379,81 +422,60 @@ def genetic_search_amplification_crossover(original_test_cases: list, amplified_
 """
 
 
-def genetic_search_amplification_mutation(original_test_cases: list, correlations):
-    """Perform genetic search to amplify the test case."""
+def genetic_search_amplification_mutation(original_test_cases: list, mutation_stats: dict = None):
+    """
+    Perform genetic search to amplify the test case.
+    :param original_test_cases: test case dicts of the original tests (see build_test_case)
+    :param mutation_stats: stats of the mutation categories of the contract, see mutation_value
+    :return: list of test case dicts, the unmutated tests followed in place by their mutated children, which know
+             the category of their mutation
+    """
 
     # Run the tests with Hardhat
     # base_output = run_hardhat_test()
     all_tests = []
-    ctr = -1
-    for test_case in original_test_cases:
-        ctr += 1
-        if len(correlations[ctr]) == 0:
-            all_tests.append(test_case)
+    for original_test_case in original_test_cases:
+        test_case = original_test_case["statements"]
+        correlations = original_test_case["correlations"]
+        if len(correlations) == 0:
+            all_tests.append(original_test_case)
             continue  # no correlations so no mutation can happen
 
-        selected_mutation_dependency = random.choice(correlations[ctr])
+        selected_mutation_dependency = random.choice(correlations)
         test_case_line_idx = selected_mutation_dependency['input_line']
         test_case_line = test_case[test_case_line_idx]
-        mutated_line, value = make_smart_mutation(test_case_line)
-
-        # if the same mutation happened (for example INT LIMIT)
-        if mutated_line == test_case_line:
-            # 1000 attempts to make a unique mutation, usually 1 is already sufficient
-            # so 1000 to make sure it basically ALWAYS works
-            for i in range(1000):
-                mutated_line, value = make_smart_mutation(test_case_line)
-
-                if mutated_line == test_case_line:
-                    continue
-                else:
-                    break
+        # the mutation never draws the current value, so a line with a literal always changes in one go
+        mutated_line, value, category = make_smart_mutation(test_case_line, mutation_stats)
 
         # copy the original test and add the mutated line in the correct spot
         new_test_cases = copy.deepcopy(test_case)
         new_test_cases[test_case_line_idx] = mutated_line
 
-        # update the mutation counter (just '== 1' for now)
-        mutation_ctr = 0
         if mutated_line != test_case_line:
-            mutation_ctr += 1
-
             # update value in dependencies IF mutation occurred
             if value is not None:
-                update_test_case_correlations(new_test_cases, test_case_line_idx, correlations[ctr], value)
+                update_test_case_correlations(new_test_cases, test_case_line_idx, correlations, value,
+                                              original_test_case["literals"])
         else:
+            # only a line without numeric literals can't be mutated
             raise ValueError("no mutation occurred")
 
-        new_test_cases_expanded = [[] for _ in range(2 ** mutation_ctr)]
-        n = len(new_test_cases_expanded)  # should ALWAYS be 2 if mutation_ctr == 1
-        alternation = 1
-        alternation_ctr = 0
-        mode = True
-        for i in range(len(test_case)):
-            if test_case[i] == new_test_cases[i]:
-                for j in range(n):
-                    new_test_cases_expanded[j].append(test_case[i])
-            elif i in [cor['assert_line'] for cor in correlations[ctr] if cor[
-                                                                              'input_line'] == test_case_line_idx]:  # same body as previous if statement but used for readability
-                for j in range(n):
-                    new_test_cases_expanded[j].append(new_test_cases[i])
-            else:
-                for j in range(n):
-                    if alternation == alternation_ctr:
-                        alternation_ctr = 0
-                        mode = not mode  # true to false or vice versa
-                    else:
-                        alternation_ctr += 1
-
-                    if mode:
-                        new_test_cases_expanded[j].append(new_test_cases[i])
-                    else:
-                        new_test_cases_expanded[j].append(update_test_case_expectancy(new_test_cases[i]))
+        # asserts that depend on the mutated line always follow it, the other changed lines (just the mutated line)
+        # are expanded into a version that keeps and one that updates their assertion. With a single line every
+        # expansion strategy gives these same two versions, the strategies only matter for the random search
+        correlated_assert_lines = [cor['assert_line'] for cor in correlations if cor['input_line'] == test_case_line_idx]
+        expanded_lines = [i for i in range(len(test_case))
+                          if test_case[i] != new_test_cases[i] and i not in correlated_assert_lines]
+        updated_lines = {i: update_test_case_expectancy(new_test_cases[i]) for i in expanded_lines}
 
-                alternation *= 2
-                alternation_ctr = 0
+        new_test_cases_expanded = []
+        for modes in full_expansion_modes(len(expanded_lines)):
+            keep_assertion = dict(zip(expanded_lines, modes))
+            new_test_cases_expanded.append([updated_lines[i] if i in keep_assertion and not keep_assertion[i]
+                                            else new_test_cases[i] for i in range(len(test_case))])
 
-        all_tests.extend(new_test_cases_expanded)
+        all_tests.extend([{**derive_test_case(original_test_case, new_test_case), "mutation": category}
+                          for new_test_case in new_test_cases_expanded])
 
     # filenames.append(filename)
 
@@ -471,19 +493,16 @@ def genetic_search_amplification_mutation(original_test_cases: list, correlation
     # pprint(original_coverage)
     # pprint(coverages)
 
-    full_test = assemble_test_cases(all_tests)
-
-    return full_test
+    return all_tests
 
 
 def extract_test_cases_beforeEach(test_code):
     # Vind de inhoud van het beforeEach-blok
-    before_each_match = re.search(r"beforeEach\s*\([^)]*\)\s*{([\s\S]*?)}", test_code)
-    if not before_each_match:
+    before_each_body = next((block_body(test_code, block) for block in scan_blocks(test_code)
+                             if block["kind"] == "beforeEach" and block_body(test_code, block) is not None), None)
+    if before_each_body is None:
         return 0
 
-    before_each_body = before_each_match.group(1)
-
     # Zoek naar deploy() en verzamel de argumenten
     deploy_match = re.search(r"deploy\s*\(\s*([^\)]*)\)", before_each_body)
     if not deploy_match:
@@ -505,13 +524,13 @@ def extract_test_cases_beforeEach(test_code):
 
 
 def extract_test_cases(test_code):
-    pattern = r'it\((?:.|\n)*?\{((?:.|\n)*?)^\s*\}\);'
-    matches = re.finditer(pattern, test_code, re.MULTILINE)
-
     test_cases = []
-    for match in matches:
-        test_body = match.group(1).strip()
-        lines = [line.strip() for line in test_body.split('\n') if line.strip()]
+    for block in scan_blocks(test_code):
+        # skipped tests (it.skip) failed before, they are not amplified
+        test_body = block_body(test_code, block) if block["kind"] == "it" else None
+        if test_body is None:
+            continue
+        lines = [line.strip() for line in test_body.strip().split('\n') if line.strip()]
         test_cases.append(lines)
 
     return test_cases
@@ -534,17 +553,21 @@ def post_process_test_cases(test_cases):
                 line = line[:comment_match.start()]
             return line.rstrip()
 
-        def brackets_balanced(s):
-            stack = []
+        # brackets that are still open in the buffer, only the new part of the buffer is scanned every line
+        open_brackets = []
+        mismatched = False
+
+        def update_brackets(s):
+            """Push and pop the brackets of s, returns False if a closing bracket doesn't match."""
             pairs = {')': '(', ']': '[', '}': '{'}
             for c in s:
                 if c in "([{":
-                    stack.append(c)
+                    open_brackets.append(c)
                 elif c in ")]}":
-                    if not stack or stack[-1] != pairs[c]:
+                    if not open_brackets or open_brackets[-1] != pairs[c]:
                         return False
-                    stack.pop()
-            return len(stack) == 0
+                    open_brackets.pop()
+            return True
 
         for line in test_case:
             clean_line = strip_comment_and_whitespace(line)
@@ -564,14 +587,17 @@ def post_process_test_cases(test_cases):
                 # it belongs to the previous line, which is in the buffer
                 else:
                     buffer += clean_line
+                    mismatched = mismatched or not update_brackets(clean_line)
                 continue
 
             if buffer:
                 buffer += " " + clean_line
             else:
                 buffer = clean_line
+            # a mismatch stays in the buffer, so the buffer can't get balanced anymore after it
+            mismatched = mismatched or not update_brackets(clean_line)
 
-            if brackets_balanced(buffer):
+            if not mismatched and not open_brackets:
                 merged_lines.append(buffer.strip())
                 buffer = ""
 
@@ -897,53 +923,215 @@ def find_correlations(lines, initial_supply=None):
     return correlations
 
 
+# numbers in parseEther are in ether, the same amount is sometimes written in wei elsewhere in the test
+ETHER_DECIMALS = 18
+# combinations of two inputs grow quadratically, only the first input numbers of a test are combined
+MAX_COMBINED_INPUTS = 32
+# the account of which a balance is asserted, and the accounts an input line moves tokens from or to
+ASSERTED_ACCOUNT_PATTERN = re.compile(r'balanceOf\(\s*(\w+)(?:\.address)?\s*\)')
+ACCOUNT_PATTERN = re.compile(r'\b(\w+)\.address\b|\.connect\(\s*(\w+)\s*\)')
+# calls that don't change a balance, their amounts are never part of one
+ALLOWANCE_CALLS = ("approve(", "increaseAllowance(", "decreaseAllowance(")
+
+
+def extract_values(line) -> list:
+    """Distinct numbers of a line, exact (int or Fraction) unlike extract_numbers, in the order it finds them."""
+    ether_match = re.findall(r'ethers\.parseEther\(["\'](\d+(\.\d+)?)["\']\)', line)
+    plain_match = re.findall(r'[^a-zA-Z0-9](\d+(\.\d+)?)[^a-zA-Z0-9]', ' ' + line + ' ')
+    # the number inside parseEther is found by both, dict keeps the first one only
+    return list(dict.fromkeys(Fraction(m[0]) if m[1] else int(m[0]) for m in ether_match + plain_match))
+
+
+def format_value(value: Fraction) -> str:
+    if value.denominator == 1:
+        return str(value.numerator)
+    return f"{Decimal(value.numerator) / Decimal(value.denominator):f}"
+
+
+def balance_accounts(line) -> set:
+    """Accounts of which an input line can change the balance: the addresses it passes and the signer it connects."""
+    if any(call in line for call in ALLOWANCE_CALLS):
+        return set()
+    return {address or signer for address, signer in ACCOUNT_PATTERN.findall(line)}
+
+
+def combined_inputs(inputs: list, initial_supply=None) -> dict:
+    """
+    Index of every number that two inputs make together: their sum, their product and what is left of the initial
+    supply after both of them. A 0 or 1 operand would make a number out of any other input, those are left out.
+    :param inputs: (line, value) of every input number
+    :return: dict that maps the combined number on the (relation, first input, second input) tuples that make it
+    """
+    index = {}
+    inputs = inputs[:MAX_COMBINED_INPUTS]
+    for i, first in enumerate(inputs):
+        for second in inputs[i + 1:]:
+            if first[1] == 0 or second[1] == 0:
+                continue
+            index.setdefault(first[1] + second[1], []).append(("sum", first, second))
+            if first[1] != 1 and second[1] != 1:
+                index.setdefault(first[1] * second[1], []).append(("product", first, second))
+            if initial_supply:
+                index.setdefault(initial_supply - first[1] - second[1], []).append(
+                    ("sub_sum_from_initial", first, second))
+    return index
+
+
+def make_correlation(in_line, in_val, out_line, out_val, relation, initial_supply=None, **extra) -> dict:
+    correlation = {
+        "input_line": in_line,
+        "assert_line": out_line,
+        "relation": relation,
+        "input_value": float(in_val),
+        "assert_value": float(out_val),
+    }
+    if relation.endswith("_initial"):
+        correlation["initial_supply"] = initial_supply
+    correlation.update(extra)
+    return correlation
+
+
 def find_correlations_structured(lines, initial_supply=None):
+    """
+    Find how the asserted numbers of a test follow from its input numbers. The input numbers are indexed by value
+    once, so every asserted number takes a few lookups instead of a comparison with every input.
+    Relations, with how the assert follows a new input value v (see correlated_value):
+      direct: v, sub_from_initial: initial_supply - v, add_to_initial: initial_supply + v,
+      ether_scaled: v * 10**scale, an amount in parseEther that is asserted in wei or the other way around,
+      sum: v + other_value, product: v * other_value, sub_sum_from_initial: initial_supply - v - other_value
+    Combinations of two inputs are only tried for an asserted balance that no single input explains, with the
+    inputs that move tokens of that account, and only when exactly one combination explains it.
+    :return: list of correlation dicts, at most one per asserted number and input number
+    """
+    index = {}  # input value -> (line, position in the line) of every input with that value
     inputs = []
     outputs = []
-    correlations = []
-
-    # Track line numbers
     for i, line in enumerate(lines):
-        nums = extract_numbers(line)
-        if 'expect' in line:
-            for num in nums:
-                outputs.append((i, num))
-        else:
-            for num in nums:
-                inputs.append((i, num))
+        for position, value in enumerate(extract_values(line)):
+            if 'expect' in line:
+                outputs.append((i, value))
+            else:
+                index.setdefault(value, []).append((i, position))
+                inputs.append((i, value))
 
+    combined_indexes = {}  # account -> combined_inputs of the inputs on its balance
+    correlations = []
     for out_line, out_val in outputs:
-        for in_line, in_val in inputs:
-            if out_val == in_val:
-                correlations.append({
-                    "input_line": in_line,
-                    "assert_line": out_line,
-                    "relation": "direct",
-                    "input_value": in_val,
-                    "assert_value": out_val
-                })
-            elif initial_supply is not None and initial_supply - in_val == out_val:
-                correlations.append({
-                    "input_line": in_line,
-                    "assert_line": out_line,
-                    "relation": "sub_from_initial",
-                    "input_value": in_val,
-                    "assert_value": out_val,
-                    "initial_supply": initial_supply
-                })
+        # candidates of every relation with a single input, the first relation found for an input wins
+        candidates = {}
+        lookups = [(out_val, "direct", {}),
+                   (Fraction(out_val, 10 ** ETHER_DECIMALS), "ether_scaled", {"scale": ETHER_DECIMALS}),
+                   (out_val * 10 ** ETHER_DECIMALS, "ether_scaled", {"scale": -ETHER_DECIMALS})]
+        if initial_supply:
+            lookups[1:1] = [(initial_supply - out_val, "sub_from_initial", {}),
+                            (out_val - initial_supply, "add_to_initial", {})]
+        for in_val, relation, extra in lookups:
+            for in_line, position in index.get(in_val, []):
+                candidates.setdefault((in_line, position), make_correlation(
+                    in_line, in_val, out_line, out_val, relation, initial_supply, **extra))
+
+        account_match = ASSERTED_ACCOUNT_PATTERN.search(lines[out_line])
+        if not candidates and account_match:
+            account = account_match.group(1)
+            if account not in combined_indexes:
+                combined_indexes[account] = combined_inputs(
+                    [(in_line, in_val) for in_line, in_val in inputs if account in balance_accounts(lines[in_line])],
+                    initial_supply)
+            combinations = combined_indexes[account].get(out_val, [])
+            # more than one combination would update the same assert differently, no way to tell which one is right
+            if len(combinations) == 1:
+                relation, first, second = combinations[0]
+                for (in_line, in_val), (_, other_val) in [(first, second), (second, first)]:
+                    correlations.append(make_correlation(in_line, in_val, out_line, out_val, relation,
+                                                         initial_supply, other_value=format_value(other_val)))
+            continue
+
+        # same order as comparing with every input one by one
+        correlations.extend(candidates[key] for key in sorted(candidates))
     return correlations
 
 
-def remove_duplicate_correlations(correlations):
-    return [list({tuple(sorted(d.items())): d for d in inner}.values()) for inner in correlations]
+def correlated_value(correlation, value):
+    """
+    New value of the assert of a correlation after its input got value.
+    :return: the value as it is written in the test, None if the relation can't follow a value like 'NaN'
+    """
+    relation = correlation['relation']
+    if relation == 'direct':
+        return value
+    try:
+        value = Fraction(value)
+    except (ValueError, TypeError):
+        return None
+
+    if relation == 'sub_from_initial':
+        new_value = correlation['initial_supply'] - value
+    elif relation == 'add_to_initial':
+        new_value = correlation['initial_supply'] + value
+    elif relation == 'ether_scaled':
+        new_value = value * Fraction(10) ** correlation['scale']
+    elif relation == 'sum':
+        new_value = value + Fraction(correlation['other_value'])
+    elif relation == 'product':
+        new_value = value * Fraction(correlation['other_value'])
+    elif relation == 'sub_sum_from_initial':
+        new_value = correlation['initial_supply'] - value - Fraction(correlation['other_value'])
+    else:
+        return None
+    return format_value(new_value)
+
+
+def build_test_case(statements: list, correlations=None, origin=None) -> dict:
+    """
+    In-memory representation of a single test case. It is built once when the test file is parsed and passed from
+    the mutation to the crossover to the final assembly, so the JS only has to be rendered at the very end.
+    :param statements: processed statements of the test, None lines are dropped just like rendering would do
+    :param correlations: correlations between the input and assert lines of these statements
+    :param origin: original test this test is or is derived from, e.g. 'original 2'
+    :return: dict with the statements, the numeric literal spans per statement, the correlations and the origin
+    """
+    statements = [line for line in statements if line is not None]
+    return {
+        "statements": statements,
+        "literals": [find_numeric_literal_spans(line) for line in statements],
+        "correlations": correlations if correlations is not None else [],
+        "origin": origin,
+    }
+
+
+def derive_test_case(parent_test_case: dict, statements: list) -> dict:
+    """Build the test case of a mutated or crossed over child, it keeps the correlations and origin of its parent."""
+    child_test_case = build_test_case(statements, origin=parent_test_case["origin"])
+    # correlations point to line indices, so they only still hold if no line got dropped
+    if len(child_test_case["statements"]) == len(parent_test_case["statements"]):
+        child_test_case["correlations"] = parent_test_case["correlations"]
+    return child_test_case
+
+
+def find_numeric_literal_spans(line: str) -> List[Tuple[int, int]]:
+    return [match.span() for match in re.finditer(NUMBER_PATTERN, line)]
+
 
+def parse_test_file(test_code: str) -> list:
+    """Parse a JS test file once into test case dicts, correlations included."""
+    initial_supply = extract_test_cases_beforeEach(test_code)
+    processed_tests = post_process_test_cases(extract_test_cases(test_code=test_code))
 
-def assemble_full_generation(*lists, original_test):
+    with stage("find_correlations"):
+        all_correlations = [find_correlations_structured(processed_test, initial_supply)
+                            for processed_test in processed_tests]
+
+    return [build_test_case(processed_test, correlations, origin=f"original {idx}")
+            for idx, (processed_test, correlations) in enumerate(zip(processed_tests, all_correlations), start=1)]
+
+
+def assemble_full_generation(*lists, original_test, numbering=None, scope: str = ""):
     all_tests = []
     for lst in lists:
-        all_tests.extend(lst)
+        all_tests.extend((test_case["origin"], test_case["statements"]) for test_case in lst)
 
-    full_test = assemble_test_cases(all_tests)
+    mutations = [test_case.get("mutation") for lst in lists for test_case in lst]
+    full_test = assemble_test_cases(all_tests, numbering, scope, mutations)
     return assemble_full_test_file(all_test_cases=full_test, original_test=original_test)
 
 
@@ -1046,19 +1234,63 @@ describe("Token Contract", function () {
 
 """
 
+def amplify_test_file(test_file, output_dir, numbering=None, mutation_stats=None):
+    """
+    Amplify a single test file: parse, correlate, mutate, crossover and write the full generation.
+    :param test_file: Path of the JS test file to amplify
+    :param output_dir: Path of the folder where the amplified test is written
+    :param numbering: numbering of the run (see test_numbering.py), the tests of this file start at 'test 1'
+    :param mutation_stats: stats of the mutation categories of this contract (see mutation_scheduler.py), the
+                           fixed weights are used when None
+    :return: Path of the amplified test file
+    """
+    test_name = test_file.stem.split('-amplified')[0]
+    current_test = test_file.read_text(encoding="utf-8")
+
+    # AMPLIFICATION STARTS HERE
+    # process the initial test once, correlations and start supply included
+    with stage("parse", test_name):
+        original_test_processed = parse_test_file(current_test)
+
+    # mutated testcases
+    with stage("mutation", test_name):
+        processed_mutated_tests = genetic_search_amplification_mutation(original_test_processed, mutation_stats)
+
+    # perform crossover
+    with stage("crossover", test_name):
+        processed_mutated_tests_final = genetic_search_amplification_crossover(original_test_processed,
+                                                                               processed_mutated_tests)
+
+    # combine all tests from the original generation, mutation and crossover, only now the JS is rendered
+    with stage("assemble", test_name):
+        final_test = assemble_full_generation(original_test_processed, processed_mutated_tests,
+                                              processed_mutated_tests_final, original_test=current_test,
+                                              numbering=numbering, scope=test_name)
+
+    output_path = output_dir / f"{test_name}-amplified.js"
+    with stage("write", test_name):
+        output_path.write_text(final_test, encoding="utf-8")
+    return output_path
+
+
 GENERATION = 2
 test_names_to_skip = ["2018-14084-test", "2018-17071-test", "2018-17877-test", "2018-19831-test"]
 
-if __name__ == "__main__":
+
+def generation_dirs(generation: int):
+    """Input and output folder of a generation, generation 1 starts from the LLM tests."""
     from pathlib import Path
 
-    if GENERATION == 1:
+    if generation == 1:
         input_dir = Path(__file__).parent / "test/claude"
-        output_base = Path(__file__).parent / f"test/genetic_search/generation{GENERATION}"
     else:
-        input_dir = Path(__file__).parent / f"test/genetic_search/success_generation{GENERATION - 1}"
-        output_base = Path(__file__).parent / f"test/genetic_search/generation{GENERATION}"
+        input_dir = Path(__file__).parent / f"test/genetic_search/success_generation{generation - 1}"
+    output_base = Path(__file__).parent / f"test/genetic_search/generation{generation}"
+    return input_dir, output_base
 
+
+if __name__ == "__main__":
+    input_dir, output_base = generation_dirs(GENERATION)
     output_base.mkdir(parents=True, exist_ok=True)
 
     for test_file in input_dir.glob("*.js"):
@@ -1067,53 +1299,7 @@ if __name__ == "__main__":
             print("SKIPPING:", test_name)
             continue
 
-        test_name = test_name.split('-amplified')[0]
-        current_test = test_file.read_text(encoding="utf-8")
-
-        test_output_dir = output_base
-        test_output_dir.mkdir(exist_ok=True)
-
-        # AMPLIFICATION STARTS HERE
-        # process the initial test and get start supply if any
-        original_test_processed = post_process_test_cases(extract_test_cases(test_code=current_test))
-        initial_supply = extract_test_cases_beforeEach(current_test)
-
-        # find all correlations
-        all_correlations = []
-        for original_processed_test in original_test_processed:
-            correlations = find_correlations_structured(original_processed_test, initial_supply)
-            all_correlations.append(correlations)
-
-        # correlations are found both ways, but you need to keep them only one-way
-        all_correlations = remove_duplicate_correlations(all_correlations)
-
-        # mutated testcases
-        amplified_test = genetic_search_amplification_mutation(original_test_processed, all_correlations)
-
-        # full mutated testfile
-        amplified_mutated = assemble_full_test_file(all_test_cases=amplified_test, original_test=current_test)
-
-        # processed tests for crossover algorithm
-        processed_mutated_tests = post_process_test_cases(extract_test_cases(test_code=amplified_mutated))
-
-        # perform crossover
-        amplified_test_final = genetic_search_amplification_crossover(original_test_processed, processed_mutated_tests,
-                                                                      all_correlations)
-
-        # full mutated and crossover testfile
-        amplified_mutated_crossover = assemble_full_test_file(all_test_cases=amplified_test_final,
-                                                              original_test=current_test)
-
-        # process the testcases for the final test
-        processed_mutated_tests_final = post_process_test_cases(
-            extract_test_cases(test_code=amplified_mutated_crossover))
-
-        # combine all tests from the original generation, mutation and crossover
-        final_test = assemble_full_generation(original_test_processed, processed_mutated_tests, processed_mutated_tests_final,
-                                     original_test=current_test)
-
-        output_path = test_output_dir / f"{test_name}-amplified.js"
-        output_path.write_text(final_test, encoding="utf-8")
+        amplify_test_file(test_file, output_base)
 
 
 # initial_supply = extract_test_cases_beforeEach(test_case_with_beforeEach)
@@ -0,0 +1,208 @@
+import json
+import random
+import shutil
+from pathlib import Path
+
+import coverage_report
+import genetic_search_amplifier
+import profiling
+from disable_failed_tests_script import find_failing_tests, disable_tests_same_folder
+from genetic_algorithm import evolve_test_files
+from hardhat_worker_pool import start_worker_pool, stop_worker_pool
+from mutation_scheduler import (load_scheduler, mutation_stats, coverage_keys, reward_mutants, add_covered,
+                                add_rewards, save_scheduler)
+from parallel_amplifier import parallel_amplification
+from prune_failing_tests import prune_failing_tests
+from suite_minimization import minimize_suite, load_suite_coverage, save_suite_coverage, cached_test_coverage
+from test_numbering import load_manifest
+from test_results import clear_test_results, load_test_results, failing_tests_by_file
+
+HARDHAT_DIR = Path(__file__).parent
+
+
+def contract_name(test_file: Path) -> str:
+    """'2018-11429-test-amplified.js' -> '2018-11429.sol', the name Hardhat uses in its coverage table."""
+    return test_file.stem.split('-test')[0] + ".sol"
+
+
+def reward_mutations(scheduler: dict, output_dir: Path, results: list, manifest: dict, coverage_path: Path,
+                     workers=None) -> dict:
+    """
+    Reward the mutation categories with the coverage of every mutant on its own (see
+    mutation_scheduler.reward_mutants). The mutants that passed in the generation run and the tests they were
+    mutated from are run one by one on the Hardhat workers, their coverage is kept in coverage_path so the
+    minimization doesn't run them again.
+    :return: category -> [successes, failures] over all contracts
+    """
+    passed = {(Path(result["file"]).name, result["title"]) for result in results
+              if result["file"] is not None and result["state"] == "passed"}
+    suite_coverage, index = load_suite_coverage(coverage_path)
+    work_dir = output_dir / "mutation_coverage"
+    totals = {}
+    pool = start_worker_pool(workers)
+    try:
+        for contract, mutants in manifest["mutations"].items():
+            test_file = output_dir / f"{contract}-amplified.js"
+            if not test_file.exists():
+                continue
+            # the tests derived from an original start with the original itself
+            original_of = {test_name: test_names[0] for test_names in manifest["files"][contract].values()
+                           for test_name in test_names}
+            passing = {test_name for test_name in mutants if (test_file.name, test_name) in passed}
+            to_run = passing | {original_of[test_name] for test_name in passing}
+            per_test = cached_test_coverage(test_file, pool, work_dir, suite_coverage, index,
+                                            {int(test_name.split()[1]) for test_name in to_run})
+
+            covered = {f"test {number}": coverage_keys(test["bits"], index) for number, test in per_test.items()
+                       if test["state"] == "passed"}
+            add_rewards(totals, reward_mutants(scheduler, contract, [
+                (category, test_name in covered, covered.get(test_name, set()),
+                 covered.get(original_of[test_name], set())) for test_name, category in mutants.items()]))
+            add_covered(scheduler, contract, set().union(*covered.values()))
+    finally:
+        stop_worker_pool(pool)
+        shutil.rmtree(work_dir, ignore_errors=True)
+        save_suite_coverage(coverage_path, suite_coverage, index)
+    return totals
+
+
+def run_generation(generation: int, seed: int = 0, workers=None, minimize: bool = False,
+                   budget_ms: float = None, scheduler_path: Path = None, evolve: bool = False) -> dict:
+    """
+    Run one full generation: amplify the survivors of the previous generation, run the coverage on the new tests,
+    disable the failing tests and write the survivors to success_generation{generation}, which is pruned until all
+    of its tests pass.
+    :param generation: number of the generation, generation 1 starts from the LLM tests
+    :param seed: seed of the run, it is combined with the generation so every generation mutates differently
+    :param workers: number of amplification processes, defaults to the number of cores
+    :param minimize: only keep the tests of the survivors that add coverage, see suite_minimization.py
+    :param budget_ms: when minimizing, keep the most coverage that runs within this many ms per contract
+    :param scheduler_path: learn the weights of the mutation categories per contract and keep them in this file
+                           over the generations (see mutation_scheduler.py), the fixed weights are used when None
+    :param evolve: amplify with the genetic algorithm (see genetic_algorithm.py) instead of the genetic search
+                   amplifier, it evaluates every test on its own and rewards the scheduler while it evolves
+    :return: coverage percentages per contract of this generation (see coverage_report.get_coverages)
+    """
+    input_dir, output_dir = genetic_search_amplifier.generation_dirs(generation)
+    # per-test coverage of the tests of this generation, the tests of an earlier run of it are different ones
+    coverage_path = output_dir.parent / f"generation{generation}_coverage.bits"
+    for stale_path in (coverage_path, coverage_path.with_name(coverage_path.name + ".json")):
+        stale_path.unlink(missing_ok=True)
+    scheduler = stats = None
+    if scheduler_path is not None:
+        scheduler = load_scheduler(scheduler_path)
+        stats = mutation_stats(scheduler, [test_file.stem.split('-amplified')[0]
+                                           for test_file in input_dir.glob("*.js")])
+    with profiling.stage("amplification"):
+        if evolve:
+            random.seed(seed + generation)
+            evolve_test_files(input_dir, output_dir, workers=workers, scheduler=scheduler)
+        else:
+            parallel_amplification("genetic", input_dir, output_dir, seed=seed + generation, workers=workers,
+                                   mutation_stats=stats)
+    if evolve and scheduler is not None:
+        save_scheduler(scheduler, scheduler_path)
+
+    # fitness evaluation, only the tests of this generation are run
+    clear_test_results()
+    with profiling.stage("fitness evaluation"):
+        output = genetic_search_amplifier.run_hardhat_test(
+            testfiles=f"{output_dir.relative_to(HARDHAT_DIR).as_posix()}/*.js")
+    output_log = HARDHAT_DIR / f"genetic_search_gen{generation}.txt"
+    output_log.write_text(output, encoding="utf-8")
+
+    results = load_test_results()
+    if results is not None:
+        (HARDHAT_DIR / f"genetic_search_gen{generation}_results.json").write_text(json.dumps(results),
+                                                                                encoding="utf-8")
+        failing_tests = failing_tests_by_file(results)
+        print(f"LOGGER: {sum(len(tests) for tests in failing_tests.values())} tests failed!")
+    else:
+        # no results file (the reporter isn't configured), fall back on the console output
+        print("LOGGER: no mocha results, reading the failing tests from the console output")
+        failing_tests = find_failing_tests(str(output_log))
+
+    # keep the fit tests, they are the input of the next generation
+    success_dir = output_dir.parent / f"success_generation{generation}"
+    success_dir.mkdir(parents=True, exist_ok=True)
+    disable_tests_same_folder(failing_tests, str(success_dir), str(output_dir),
+                              manifest_path=success_dir.parent / f"success_generation{generation}_skipped.json")
+
+    # read before the pruning runs, they overwrite the coverage of the generation
+    coverage = coverage_report.load_coverage(HARDHAT_DIR / "coverage" / "coverage-final.json")
+
+    # the genetic algorithm rewarded the scheduler while evolving, it writes no manifest
+    if scheduler is not None and results is not None and not evolve:
+        with profiling.stage("mutation rewards"):
+            rewards = reward_mutations(scheduler, output_dir, results,
+                                       load_manifest(output_dir.parent / f"{output_dir.name}_manifest.json"),
+                                       coverage_path, workers=workers)
+        save_scheduler(scheduler, scheduler_path)
+        summary = ", ".join(f"{category} {wins}/{wins + losses}" for category, (wins, losses) in rewards.items())
+        print(f"LOGGER: mutants that passed with new coverage per category: {summary}")
+
+    # tests that only passed because a test before them failed can fail now, run the files with skipped tests again
+    # the pruning reads the mocha results of its runs, without the reporter it can't tell which tests fail
+    if results is None:
+        print("LOGGER: no mocha results, the survivors are not pruned")
+    else:
+        with profiling.stage("pruning"):
+            prune_failing_tests(success_dir, [test_file for test_file, tests in failing_tests.items()
+                                              if tests and (success_dir / test_file).exists()])
+
+    if minimize:
+        with profiling.stage("minimization"):
+            minimized = minimize_suite(success_dir, workers=workers, budget_ms=budget_ms,
+                                       coverage_path=coverage_path)
+            if budget_ms is not None:
+                # the trade-off between coverage and runtime per contract, to pick another budget afterwards
+                (success_dir.parent / f"success_generation{generation}_pareto.json").write_text(
+                    json.dumps(minimized, indent=2), encoding="utf-8")
+
+    return coverage_report.get_coverages(coverage, [contract_name(f) for f in output_dir.glob("*.js")])
+
+
+def genetic_search(start_generation: int, num_generations: int, seed: int = 0, workers=None,
+                   minimize: bool = False, budget_ms: float = None, scheduler_path: Path = None,
+                   evolve: bool = False) -> dict:
+    """
+    Run num_generations generations end to end, every generation continues on the survivors of the previous one.
+    :return: dict that maps every generation on its coverage per contract
+    """
+    history = {}
+    for generation in range(start_generation, start_generation + num_generations):
+        print(f"LOGGER: generation {generation} started")
+        history[generation] = run_generation(generation, seed=seed, workers=workers, minimize=minimize,
+                                             budget_ms=budget_ms, scheduler_path=scheduler_path, evolve=evolve)
+        print(f"LOGGER: generation {generation} done, coverage of {len(history[generation])} contracts measured")
+
+        # written after every generation so a crashed run still has the coverage of the finished generations
+        history_path = HARDHAT_DIR / "genetic_search_history.json"
+        history_path.write_text(json.dumps(history, indent=2), encoding="utf-8")
+
+        if profiling.PROFILING:
+            # open genetic_search_trace.json in chrome://tracing or https://ui.perfetto.dev
+            profiling.write_profile(HARDHAT_DIR / "genetic_search_profile.json")
+            profiling.write_chrome_trace(HARDHAT_DIR / "genetic_search_trace.json")
+
+    return history
+
+
+START_GENERATION = 1
+NUM_GENERATIONS = 3
+SEED = 0
+NUM_WORKERS = None  # None uses all cores
+PROFILE = False  # time and memory per stage and contract, see profiling.py
+MINIMIZE = False  # set cover of the survivors on their coverage per test, see suite_minimization.py
+RUNTIME_BUDGET_MS = None  # with MINIMIZE, e.g. 30000: the best coverage within 30 seconds per contract
+# e.g. HARDHAT_DIR / "mutation_scheduler.json": learn the weights of the mutation categories per contract, remove the
+# file to start over (see mutation_scheduler.py). Costs a second worker pool every generation that runs every passing
+# mutant and its original on their own with coverage, with MINIMIZE that coverage is reused by the minimization
+SCHEDULER_PATH = None
+EVOLVE = False  # amplify with the genetic algorithm instead of the genetic search amplifier, see genetic_algorithm.py
+
+if __name__ == "__main__":
+    if PROFILE:
+        profiling.enable_profiling()
+    genetic_search(START_GENERATION, NUM_GENERATIONS, seed=SEED, workers=NUM_WORKERS, minimize=MINIMIZE,
+                   budget_ms=RUNTIME_BUDGET_MS, scheduler_path=SCHEDULER_PATH, evolve=EVOLVE)
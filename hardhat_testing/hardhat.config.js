@@ -2,7 +2,9 @@
 require("@nomiclabs/hardhat-truffle5");
 require("solidity-coverage");
 require("@nomicfoundation/hardhat-ethers"); // Added ethers plugin
+const path = require("path");
 require("@nomicfoundation/hardhat-chai-matchers");
+require("./solc_cache"); // shared cache of the solc output, see solc_cache.js
 
 module.exports = {
   solidity: {
@@ -42,6 +44,10 @@ module.exports = {
       chainId: 1337, // Hardhat's default in-memory chain
     },
   },
+  mocha: {
+    // spec output plus mocha_results.json with the result of every test, see mocha_results_reporter.js
+    reporter: path.join(__dirname, "mocha_results_reporter.js"),
+  },
   paths: {
     sources: "./contracts", // Path to contracts
     tests: "./test",        // Path to test files
@@ -0,0 +1,10 @@
+// Config of the long-lived test workers (see hardhat_worker.js and hardhat_worker_pool.py).
+// Same settings as hardhat.config.js, only the test task is replaced by the request loop of the worker.
+const config = require("./hardhat.config");
+const { task } = require("hardhat/config");
+const { TASK_TEST } = require("hardhat/builtin-tasks/task-names");
+const { serveTestRequests } = require("./hardhat_worker");
+
+task(TASK_TEST).setAction(async (_, hre) => serveTestRequests(hre));
+
+module.exports = config;
@@ -0,0 +1,81 @@
+// Long-lived test worker, started by hardhat_worker_pool.py.
+// The coverage task compiles the instrumented contracts and attaches to the Hardhat network once, after that it
+// calls the test task. hardhat.worker.config.js replaces that task by serveTestRequests, which keeps answering
+// "run these test files" requests from stdin until stdin is closed, so Node, the plugins and the compilation are
+// only paid for once per worker.
+const path = require("path");
+const readline = require("readline");
+const Mocha = require("mocha");
+
+// every line meant for Python starts with this, everything else on stdout is Hardhat or test output
+const MARKER = "@@worker ";
+
+function respond(message) {
+  process.stdout.write(MARKER + JSON.stringify(message) + "\n");
+}
+
+function resetHits(api) {
+  const instrumentationData = api.getInstrumentationData();
+  for (const key of Object.keys(instrumentationData)) {
+    instrumentationData[key].hits = 0;
+  }
+}
+
+function runMocha(hre, testFiles) {
+  return new Promise((resolve) => {
+    const results = [];
+    const requestedPaths = {};
+    const mocha = new Mocha({ ...hre.config.mocha, reporter: Mocha.reporters.Base });
+
+    for (const testFile of testFiles) {
+      const absolutePath = path.resolve(testFile);
+      requestedPaths[absolutePath] = testFile;
+      // a file that was run before is still in the require cache and would not register its tests again
+      delete require.cache[absolutePath];
+      mocha.addFile(absolutePath);
+    }
+
+    const record = (state) => (test, err) => {
+      results.push({
+        file: requestedPaths[test.file] || test.file,
+        title: test.title,
+        full_title: test.fullTitle(),
+        state: state,
+        duration: test.duration || 0,
+        error: err ? String(err.message) : null,
+      });
+    };
+
+    const runner = mocha.run((failures) => {
+      mocha.dispose();
+      resolve({ failures, results });
+    });
+    runner.on("pass", record("passed"));
+    runner.on("fail", record("failed"));
+    runner.on("pending", record("pending"));
+  });
+}
+
+async function serveTestRequests(hre) {
+  // set by the onServerReady hook in .solcover.worker.js
+  const api = global.coverageApi;
+  const lines = readline.createInterface({ input: process.stdin });
+
+  respond({ id: null, ready: true });
+  for await (const line of lines) {
+    if (!line.trim()) continue;
+
+    const request = JSON.parse(line);
+    try {
+      if (api) resetHits(api);
+      const { failures, results } = await runMocha(hre, request.files);
+      if (api && request.coverage_dir) await api.report(request.coverage_dir);
+      respond({ id: request.id, failures, results, coverage_dir: request.coverage_dir });
+    } catch (e) {
+      respond({ id: request.id, error: String((e && e.stack) || e) });
+    }
+  }
+  return 0;
+}
+
+module.exports = { serveTestRequests };
@@ -0,0 +1,137 @@
+import json
+import os
+import queue
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from profiling import stage
+
+HARDHAT_DIR = Path(__file__).parent
+WORKER_BASE = HARDHAT_DIR / "hardhat_workers"
+
+# lines on stdout that start with this are messages of the worker, see hardhat_worker.js
+WORKER_MARKER = "@@worker "
+WORKER_FILES = ["hardhat.config.js", "solc_cache.js", "hardhat.worker.config.js", "hardhat_worker.js",
+                ".solcover.worker.js"]
+WORKER_COMMAND = ["wsl", "npx", "hardhat", "--config", "hardhat.worker.config.js", "coverage",
+                  "--solcoverjs", "./.solcover.worker.js"]
+
+
+def prepare_worker_dir(worker_dir: Path, contracts_dir: Path):
+    """Every worker gets its own folder so the instrumented compilation, cache and artifacts don't collide."""
+    if worker_dir.exists():
+        shutil.rmtree(worker_dir)
+    (worker_dir / "contracts").mkdir(parents=True)
+    (worker_dir / "requests").mkdir()
+
+    for worker_file in WORKER_FILES:
+        shutil.copy(HARDHAT_DIR / worker_file, worker_dir / worker_file)
+    for contract in contracts_dir.glob("*.sol"):
+        shutil.copy(contract, worker_dir / "contracts" / contract.name)
+
+
+def read_message(worker: dict) -> dict:
+    """Wait for the next message of a worker, the Hardhat and test output in between goes to its log."""
+    while True:
+        line = worker["process"].stdout.readline()
+        if line == "":
+            raise RuntimeError(f"worker {worker['dir'].name} stopped, see {worker['dir'] / 'output.txt'}")
+        if line.startswith(WORKER_MARKER):
+            return json.loads(line[len(WORKER_MARKER):])
+        worker["log"].write(line)
+
+
+def start_worker(worker_dir: Path, contracts_dir: Path = HARDHAT_DIR / "contracts", command=None) -> dict:
+    """
+    Start a long-lived Hardhat worker and wait until it compiled the contracts and is ready for requests.
+    :param worker_dir: folder of the worker, it is rebuilt from scratch
+    :param contracts_dir: contracts the worker measures the coverage of
+    :param command: command that starts the worker, defaults to WORKER_COMMAND
+    :return: dict that is passed to run_tests and stop_worker
+    """
+    prepare_worker_dir(worker_dir, contracts_dir)
+    process = subprocess.Popen(
+        command or WORKER_COMMAND, cwd=worker_dir,
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        text=True, encoding='utf-8', bufsize=1
+    )
+    worker = {"process": process, "dir": worker_dir, "requests": 0,
+              "log": open(worker_dir / "output.txt", "w", encoding="utf-8")}
+    read_message(worker)  # ready message
+    return worker
+
+
+def run_tests(worker: dict, test_files: list, with_coverage: bool = True) -> dict:
+    """
+    Let a worker run the given test files.
+    :return: dict with the number of failures, a result per test (file, title, state, duration, error) and the
+             coverage-final.json content of only these test files (empty without coverage)
+    """
+    worker["requests"] += 1
+    request_id = worker["requests"]
+
+    # the worker runs in its own folder, so the paths are sent relative to it
+    relative_paths = {os.path.relpath(Path(test_file).resolve(), worker["dir"].resolve()).replace("\\", "/"): test_file
+                      for test_file in test_files}
+    coverage_dir = f"requests/{request_id}" if with_coverage else None
+    with stage("hardhat worker", worker["dir"].name):
+        worker["process"].stdin.write(json.dumps({"id": request_id, "files": list(relative_paths),
+                                                  "coverage_dir": coverage_dir}) + "\n")
+        worker["process"].stdin.flush()
+        response = read_message(worker)
+    if response.get("id") != request_id:
+        raise RuntimeError(f"worker {worker['dir'].name} answered request {response.get('id')} instead of {request_id}")
+    if "error" in response:
+        raise RuntimeError(f"worker {worker['dir'].name} failed: {response['error']}")
+
+    for result in response["results"]:
+        result["file"] = str(relative_paths.get(result["file"], result["file"]))
+
+    coverage = {}
+    coverage_path = worker["dir"] / coverage_dir / "coverage-final.json" if coverage_dir else None
+    if coverage_path is not None and coverage_path.exists():
+        with open(coverage_path, "r", encoding="utf-8") as f:
+            coverage = json.load(f)
+        shutil.rmtree(coverage_path.parent)
+
+    return {"failures": response["failures"], "results": response["results"], "coverage": coverage}
+
+
+def stop_worker(worker: dict):
+    # closing stdin ends the request loop, after that the coverage task finishes normally
+    worker["process"].stdin.close()
+    worker["process"].wait()
+    worker["log"].close()
+
+
+def start_worker_pool(num_workers=None, contracts_dir: Path = HARDHAT_DIR / "contracts", command=None) -> queue.Queue:
+    """Start num_workers workers at the same time (defaults to the number of cores), returns a queue of idle ones."""
+    num_workers = num_workers or os.cpu_count()
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        workers = list(executor.map(lambda idx: start_worker(WORKER_BASE / f"worker{idx}", contracts_dir, command),
+                                    range(num_workers)))
+
+    pool = queue.Queue()
+    for worker in workers:
+        pool.put(worker)
+    return pool
+
+
+def run_on_pool(pool: queue.Queue, batches: list, with_coverage: bool = True) -> list:
+    """Run every batch of test files on the first idle worker, returns the results in the order of the batches."""
+    def run_batch(test_files):
+        worker = pool.get()
+        try:
+            return run_tests(worker, test_files, with_coverage)
+        finally:
+            pool.put(worker)
+
+    with ThreadPoolExecutor(max_workers=pool.qsize()) as executor:
+        return list(executor.map(run_batch, batches))
+
+
+def stop_worker_pool(pool: queue.Queue):
+    while not pool.empty():
+        stop_worker(pool.get())
@@ -0,0 +1,136 @@
+import re
+
+# mocha calls that open a block, 'it.skip' and 'describe.only' etc. are found as well
+BLOCK_NAMES = ["describe", "context", "beforeEach", "before", "afterEach", "after", "it"]
+
+# the scanner only has to stop at strings, comments ('/') and braces, parentheses and square brackets are not needed
+# to find the blocks. A single character class keeps the search fast
+TOKEN_PATTERN = re.compile(r'["\'`{}/]')
+# block calls are searched per name, a pattern that starts with a literal is a lot faster than one alternation
+CALL_PATTERNS = [re.compile(name + r'\b((?:\s*\.\s*[A-Za-z_$][\w$]*)*)\s*\(') for name in BLOCK_NAMES]
+TEMPLATE_TOKEN_PATTERN = re.compile(r'\\[\s\S]|`|\$\{')
+STRING_PATTERNS = {quote: re.compile(quote + r'(?:[^' + quote + r'\\\n]|\\[\s\S])*' + quote + '?') for quote in '"\''}
+CALL_END_PATTERN = re.compile(r'\s*\)(?:[ \t]*;)?')
+
+
+def string_value(code: str, pos: int):
+    """Content of the string literal that starts at pos (after whitespace), None if there is none."""
+    while pos < len(code) and code[pos].isspace():
+        pos += 1
+    if pos >= len(code):
+        return None
+    if code[pos] in STRING_PATTERNS:
+        return STRING_PATTERNS[code[pos]].match(code, pos).group()[1:-1]
+    if code[pos] == '`':
+        end = code.find('`', pos + 1)
+        return code[pos + 1:end] if end != -1 else None
+    return None
+
+
+def find_calls(code: str) -> list:
+    """
+    Matches of the block calls in source order, also the ones inside strings and comments (scan_blocks drops those).
+    Names after a '.' or inside a longer name (emit(, submit(, item() are member calls or other functions.
+    """
+    calls = []
+    for pattern in CALL_PATTERNS:
+        for match in pattern.finditer(code):
+            before = code[match.start() - 1] if match.start() > 0 else ' '
+            if not (before.isalnum() or before in '_$.'):
+                calls.append(match)
+    return sorted(calls, key=lambda match: match.start())
+
+
+def scan_blocks(code: str) -> list:
+    """
+    Find the describe, beforeEach, it, ... blocks of a JS test file in a single pass. Strings, template literals and
+    comments are skipped, so braces inside them don't count. Regex literals are not recognized, test files
+    don't use them.
+    :param code: content of the test file
+    :return: list of dicts in source order with the kind ('it', 'it.skip', 'describe', ...), the title, the
+             parent (index of the enclosing block, None at the top) and the character offsets: 'start' of the call,
+             'body_start' and 'body_end' of the function body between its braces and 'end' after the call (and its
+             ';'). Offsets of a block that is not closed in the code are None.
+    """
+    blocks = []
+    stack = []  # open braces, with the index of the block for the brace of a block body
+    pending = None  # block whose call is opened but whose body didn't start yet
+    calls = find_calls(code)
+    next_call = 0
+    pos = 0
+    in_template = False
+    while True:
+        if in_template:
+            match = TEMPLATE_TOKEN_PATTERN.search(code, pos)
+            if match is None:
+                break
+            pos = match.end()
+            if match.group() == '`':
+                in_template = False
+            elif match.group() == '${':
+                # the expression is code again until its closing brace
+                stack.append(('${', None))
+                in_template = False
+            continue
+
+        match = TOKEN_PATTERN.search(code, pos)
+        token_start = match.start() if match is not None else len(code)
+
+        # calls between the previous token and this one are code, the ones before pos were in a string or comment
+        while next_call < len(calls) and calls[next_call].start() < token_start:
+            call = calls[next_call]
+            next_call += 1
+            if call.start() < pos:
+                continue
+            blocks.append({
+                "kind": re.sub(r'\s', '', call.group()[:-1]),
+                "title": string_value(code, call.end()),
+                "parent": next((idx for _, idx in reversed(stack) if idx is not None), None),
+                "start": call.start(),
+                "body_start": None,
+                "body_end": None,
+                "end": None,
+            })
+            pending = len(blocks) - 1
+
+        if match is None:
+            break
+        token = match.group()
+        pos = token_start + 1
+
+        if token in STRING_PATTERNS:
+            pos = STRING_PATTERNS[token].match(code, token_start).end()
+        elif token == '`':
+            in_template = True
+        elif token == '/':
+            # a single '/' is a division
+            if code.startswith('/', pos):
+                newline = code.find('\n', pos)
+                pos = len(code) if newline == -1 else newline
+            elif code.startswith('*', pos):
+                close = code.find('*/', pos + 1)
+                pos = len(code) if close == -1 else close + 2
+        elif token == '{':
+            # the first brace after the call is the body of the function that is passed to it
+            stack.append(('{', pending))
+            if pending is not None:
+                blocks[pending]["body_start"] = pos
+                pending = None
+        elif stack:
+            brace, idx = stack.pop()
+            if brace == '${':
+                in_template = True
+            elif idx is not None:
+                blocks[idx]["body_end"] = token_start
+                call_end = CALL_END_PATTERN.match(code, pos)
+                blocks[idx]["end"] = call_end.end() if call_end else pos
+        # a closing brace without an opening one is ignored
+
+    return blocks
+
+
+def block_body(code: str, block: dict):
+    """Code between the braces of the function body of a block, None if it has no (closed) body."""
+    if block["body_start"] is None or block["body_end"] is None:
+        return None
+    return code[block["body_start"]:block["body_end"]]
@@ -0,0 +1,171 @@
+import json
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import genetic_search_amplifier as gsa
+
+HARDHAT_DIR = Path(__file__).parent
+BENCH_DIRS = [HARDHAT_DIR.parent / "Datasets/Test_Bench1/test", HARDHAT_DIR.parent / "Datasets/Test_Bench2/test"]
+BASELINE_PATH = HARDHAT_DIR / "benchmark_baselines.json"
+
+# a benchmark fails when its ops/sec drop more than this below the baseline
+REGRESSION_THRESHOLD = 0.25
+# every benchmark repeats until it ran this long, the fastest round counts
+MIN_TIME = 1.0
+SEED = 0
+# synthetic files: this many bench files amplified in memory for this many generations, like the genetic driver
+SYNTHETIC_FILES = 10
+SYNTHETIC_GENERATIONS = 2
+
+
+def load_corpus(bench_dirs=BENCH_DIRS) -> list:
+    """(name, code) of every JS test of the benches."""
+    return [(test_file.stem, test_file.read_text(encoding="utf-8"))
+            for bench_dir in bench_dirs for test_file in sorted(bench_dir.glob("*.js"))]
+
+
+def synthetic_generations(corpus: list, generations: int = SYNTHETIC_GENERATIONS,
+                          num_files: int = SYNTHETIC_FILES, seed: int = SEED) -> list:
+    """
+    Generation-N test files: the first num_files of the corpus amplified generations times in memory, the output of
+    every generation is the input of the next one. Files that can't be amplified are left out.
+    """
+    random.seed(seed)
+    synthetic = []
+    for name, code in corpus[:num_files]:
+        try:
+            for _ in range(generations):
+                original = gsa.parse_test_file(code)
+                mutated = gsa.genetic_search_amplification_mutation(original)
+                crossed = gsa.genetic_search_amplification_crossover(original, mutated)
+                code = gsa.assemble_full_generation(original, mutated, crossed, original_test=code, scope=name)
+        except Exception as e:
+            print(f"LOGGER: no synthetic generation for {name}: {e!r}")
+            continue
+        synthetic.append((f"{name}-generation{generations}", code))
+    return synthetic
+
+
+def prepare_inputs(files: list) -> dict:
+    """The inputs of every benchmarked function, made once so the benchmarks only measure the function itself."""
+    raw_tests = [gsa.extract_test_cases(code) for _, code in files]
+    processed = [gsa.post_process_test_cases(tests) for tests in raw_tests]
+    initial_supplies = [gsa.extract_test_cases_beforeEach(code) for _, code in files]
+    lines = [line for tests in processed for test in tests for line in test]
+    numbered_lines = [line for line in lines if gsa.find_numeric_literal_spans(line)]
+    return {
+        "codes": [code for _, code in files],
+        "raw_tests": raw_tests,
+        "correlation_inputs": [(test, initial_supply) for tests, initial_supply in zip(processed, initial_supplies)
+                               for test in tests],
+        "lines": numbered_lines,
+        "line_pairs": list(zip(numbered_lines, numbered_lines[1:])),
+        "assemble_inputs": [[(f"original {idx}", test) for idx, test in enumerate(tests, start=1)]
+                            for tests in processed],
+    }
+
+
+def benchmark_functions(inputs: dict) -> dict:
+    """Name -> (function that runs one round, number of operations in a round)."""
+    return {
+        "extract_test_cases": (lambda: [gsa.extract_test_cases(code) for code in inputs["codes"]],
+                               len(inputs["codes"])),
+        "post_process_test_cases": (lambda: [gsa.post_process_test_cases(tests) for tests in inputs["raw_tests"]],
+                                    len(inputs["raw_tests"])),
+        "make_smart_mutation": (lambda: [gsa.make_smart_mutation(line) for line in inputs["lines"]],
+                                len(inputs["lines"])),
+        "find_correlations_structured": (lambda: [gsa.find_correlations_structured(test, initial_supply)
+                                                  for test, initial_supply in inputs["correlation_inputs"]],
+                                         len(inputs["correlation_inputs"])),
+        "crossover": (lambda: [gsa.crossover(line1, line2) for line1, line2 in inputs["line_pairs"]],
+                      len(inputs["line_pairs"])),
+        "assemble_test_cases": (lambda: [gsa.assemble_test_cases(tests) for tests in inputs["assemble_inputs"]],
+                                len(inputs["assemble_inputs"])),
+    }
+
+
+def run_benchmark(function, num_ops: int, min_time: float = MIN_TIME) -> dict:
+    """
+    Time rounds of function until min_time passed, then measure the peak allocations of one extra round.
+    :return: ops/sec of the fastest round, number of rounds and the peak memory of a round in bytes
+    """
+    rounds = []
+    start = time.perf_counter()
+    while not rounds or time.perf_counter() - start < min_time:
+        random.seed(SEED)
+        round_start = time.perf_counter()
+        function()
+        rounds.append(time.perf_counter() - round_start)
+
+    random.seed(SEED)
+    tracemalloc.start()
+    function()
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    fastest = min(rounds)
+    return {"ops": num_ops, "ops_per_sec": num_ops / fastest if fastest > 0 else float("inf"),
+            "rounds": len(rounds), "peak_bytes": peak_bytes}
+
+
+def run_suite(corpora: dict, min_time: float = MIN_TIME) -> dict:
+    """
+    :param corpora: name of the corpus -> list of (name, code)
+    :return: result of every benchmark by '{corpus}:{function}'
+    """
+    results = {}
+    for corpus_name, files in corpora.items():
+        for name, (function, num_ops) in benchmark_functions(prepare_inputs(files)).items():
+            results[f"{corpus_name}:{name}"] = run_benchmark(function, num_ops, min_time)
+            result = results[f"{corpus_name}:{name}"]
+            print(f"{corpus_name + ':' + name:45} {result['ops_per_sec']:>12.1f} ops/s "
+                  f"{result['peak_bytes'] / 1024:>10.1f} KiB peak  ({result['ops']} ops, {result['rounds']} rounds)")
+    return results
+
+
+def find_regressions(results: dict, baselines: dict, threshold: float = REGRESSION_THRESHOLD) -> list:
+    """Benchmarks whose ops/sec are more than threshold below their baseline, with the ratio to the baseline."""
+    regressions = []
+    for name, result in results.items():
+        if name not in baselines:
+            continue
+        ratio = result["ops_per_sec"] / baselines[name]["ops_per_sec"]
+        if ratio < 1 - threshold:
+            regressions.append((name, ratio))
+    return regressions
+
+
+def load_baselines(path: Path = BASELINE_PATH) -> dict:
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baselines(results: dict, path: Path = BASELINE_PATH):
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    tmp_path.replace(path)
+
+
+UPDATE_BASELINES = False  # store the results of this run as the new baselines instead of comparing
+
+if __name__ == "__main__":
+    corpus = load_corpus()
+    corpora = {"bench": corpus,
+               f"generation{SYNTHETIC_GENERATIONS}": synthetic_generations(corpus)}
+    results = run_suite(corpora)
+
+    baselines = load_baselines()
+    if UPDATE_BASELINES or not baselines:
+        save_baselines(results)
+        print(f"LOGGER: baselines written to {BASELINE_PATH.name}")
+        sys.exit(0)
+
+    regressions = find_regressions(results, baselines)
+    for name, ratio in regressions:
+        print(f"LOGGER: REGRESSION {name}: {ratio:.0%} of the baseline ops/sec")
+    sys.exit(1 if regressions else 0)
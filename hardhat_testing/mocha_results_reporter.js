@@ -0,0 +1,40 @@
+// Mocha reporter of hardhat.config.js: the normal spec output on the console, plus every test result in
+// mocha_results.json next to the config, so Python reads the results instead of parsing the console (see
+// test_results.py). The results have the same fields as the ones of hardhat_worker.js.
+const fs = require("fs");
+const path = require("path");
+const Mocha = require("mocha");
+
+const { EVENT_TEST_PASS, EVENT_TEST_FAIL, EVENT_TEST_PENDING, EVENT_RUN_END } = Mocha.Runner.constants;
+const RESULTS_FILE = process.env.MOCHA_RESULTS_FILE || path.join(process.cwd(), "mocha_results.json");
+
+class ResultsReporter extends Mocha.reporters.Spec {
+  constructor(runner, options) {
+    super(runner, options);
+    const results = [];
+
+    const record = (state) => (test, err) => {
+      results.push({
+        // relative to the folder that was run, so it is the same path for Windows and WSL
+        file: test.file ? path.relative(process.cwd(), test.file).split(path.sep).join("/") : null,
+        title: test.title,
+        full_title: test.fullTitle(),
+        state: state,
+        duration: test.duration || 0,
+        error: err ? String(err.message) : null,
+      });
+    };
+    runner.on(EVENT_TEST_PASS, record("passed"));
+    runner.on(EVENT_TEST_FAIL, record("failed"));
+    runner.on(EVENT_TEST_PENDING, record("pending"));
+
+    runner.once(EVENT_RUN_END, () => {
+      // write and rename, a run that crashes halfway never leaves half a result file behind
+      const tmpPath = `${RESULTS_FILE}.${process.pid}.tmp`;
+      fs.writeFileSync(tmpPath, JSON.stringify({ stats: this.stats, results: results }));
+      fs.renameSync(tmpPath, RESULTS_FILE);
+    });
+  }
+}
+
+module.exports = ResultsReporter;
@@ -0,0 +1,87 @@
+import json
+import random
+from pathlib import Path
+
+from coverage_bitsets import covered_items
+
+# Adaptive weights of the mutation categories (genetic_search_amplifier.MUTATION_CATEGORIES), learned per contract.
+# Every category counts its mutants that passed and covered something new on their own (successes) and the ones that
+# didn't (failures).
+# A draw samples Beta(successes + 1, failures + 1) of every category and takes the highest (Thompson sampling), so
+# a category that keeps reverting, like negative values for uint parameters, is soon hardly drawn anymore while
+# one that hasn't been tried much still gets its chance.
+
+
+def new_scheduler() -> dict:
+    """Per contract (the name of its test file, '2018-10299-test'): the stats of every category and what it covered."""
+    return {"contracts": {}}
+
+
+def contract_entry(scheduler: dict, contract: str) -> dict:
+    return scheduler["contracts"].setdefault(contract, {"categories": {}, "covered": []})
+
+
+def mutation_stats(scheduler: dict, contracts: list) -> dict:
+    """
+    The input of the amplifier: contract -> category -> [successes, failures]. Contracts without any outcome yet
+    are left out, they are mutated with the fixed weights.
+    """
+    return {contract: scheduler["contracts"][contract]["categories"] for contract in contracts
+            if scheduler["contracts"].get(contract, {}).get("categories")}
+
+
+def thompson_choice(categories: list, stats: dict) -> int:
+    """Index of the category with the highest sample of its Beta posterior."""
+    samples = [random.betavariate(successes + 1, failures + 1)
+               for successes, failures in (stats.get(category, (0, 0)) for category in categories)]
+    return max(range(len(categories)), key=samples.__getitem__)
+
+
+def coverage_keys(bits: int, index: dict) -> set:
+    """What a coverage bitset (see coverage_bitsets.py) hit as strings, 's:2018-10299.sol:3', so it fits in JSON."""
+    return {":".join(map(str, item)) for item in covered_items(bits, index)}
+
+
+def reward_mutants(scheduler: dict, contract: str, mutants: list) -> dict:
+    """
+    Reward the categories of the mutants of a contract with the coverage of every mutant on its own: a mutant is a
+    success when it passed and covered something that the test it was mutated from and the earlier generations
+    didn't cover.
+    :param mutants: (category, passed, covered, covered by its original) per mutant, covered as coverage_keys
+    :return: category -> [successes, failures] of these mutants
+    """
+    entry = contract_entry(scheduler, contract)
+    seen = set(entry["covered"])
+    rewards = {}
+    for category, passed, covered, original_covered in mutants:
+        success = passed and bool(covered - original_covered - seen)
+        for stats in (entry["categories"].setdefault(category, [0, 0]), rewards.setdefault(category, [0, 0])):
+            stats[0 if success else 1] += 1
+    return rewards
+
+
+def add_covered(scheduler: dict, contract: str, covered: set):
+    """Remember what the tests of a generation covered, the mutants of the next generations have to beat it."""
+    entry = contract_entry(scheduler, contract)
+    entry["covered"] = sorted(covered | set(entry["covered"]))
+
+
+def add_rewards(totals: dict, rewards: dict):
+    for category, (successes, failures) in rewards.items():
+        stats = totals.setdefault(category, [0, 0])
+        stats[0] += successes
+        stats[1] += failures
+
+
+def load_scheduler(path: Path) -> dict:
+    """The scheduler of the earlier generations, a new one if there is none yet."""
+    if not path.exists():
+        return new_scheduler()
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_scheduler(scheduler: dict, path: Path):
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(scheduler, indent=2), encoding="utf-8")
+    tmp_path.replace(path)
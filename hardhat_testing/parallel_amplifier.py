@@ -0,0 +1,112 @@
+import hashlib
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import genetic_search_amplifier
+import random_search_amplifier
+import profiling
+from profiling import stage, take_records, add_records
+from test_numbering import new_numbering, get_manifest, merge_manifests, write_manifest
+
+AMPLIFIERS = {
+    "genetic": genetic_search_amplifier,
+    "random": random_search_amplifier,
+}
+
+
+def file_seed(seed: int, test_name: str) -> int:
+    """
+    Seed for a single test file. It only depends on the run seed and the name of the test, so the amplified output
+    is the same no matter how many workers are used or in which order the files are picked up.
+    """
+    digest = hashlib.sha256(f"{seed}:{test_name}".encode("utf-8")).hexdigest()
+    return int(digest[:16], 16)
+
+
+def amplify_file_worker(amplifier_name: str, test_file: Path, output_dir: Path, seed: int, run_id: str,
+                        mutation_stats: dict = None):
+    """
+    Amplify one test file inside a worker process, this is everything from parse until write for that file.
+    :param mutation_stats: stats of the mutation categories of the contract, only the genetic search uses them
+    :return: what the amplifier returned, the manifest of the file (see test_numbering.py) and the profile records
+             of the file (see profiling.py), empty when profiling is off
+    """
+    amplifier = AMPLIFIERS[amplifier_name]
+    random.seed(seed)
+    # the tests of every file are numbered on their own, so it doesn't matter which files this worker did before
+    numbering = new_numbering(run_id)
+    options = {"mutation_stats": mutation_stats} if amplifier_name == "genetic" and mutation_stats is not None else {}
+    with stage("amplify", test_file.stem):
+        result = amplifier.amplify_test_file(test_file, output_dir, numbering=numbering, **options)
+    return result, get_manifest(numbering), take_records()
+
+
+def parallel_amplification(amplifier_name: str, input_dir: Path, output_dir: Path, seed: int = 0, workers=None,
+                           manifest_path=None, mutation_stats: dict = None):
+    """
+    Amplify all test files of a bench over a process pool. Every test file is independent so it is one task.
+    :param amplifier_name: 'genetic' or 'random'
+    :param input_dir: folder with the JS tests to amplify
+    :param output_dir: folder where the amplified tests are written
+    :param seed: seed of the run, every file gets its own seed derived from it (see file_seed)
+    :param workers: number of processes, defaults to the number of cores
+    :param manifest_path: where the manifest from original to amplified tests is written, defaults to
+                          '{output_dir}_manifest.json' next to the output folder
+    :param mutation_stats: test name -> stats of its mutation categories (see mutation_scheduler.mutation_stats)
+    :return: dict that maps the test name on what the amplifier returned for it
+    """
+    amplifier = AMPLIFIERS[amplifier_name]
+    run_id = f"{amplifier_name}-{seed}"
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    test_files = []
+    for test_file in sorted(input_dir.glob("*.js")):
+        if test_file.stem in amplifier.test_names_to_skip:
+            print("SKIPPING:", test_file.stem)
+            continue
+        test_files.append(test_file)
+
+    results = {}
+    manifests = []
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = {test_file.stem: executor.submit(amplify_file_worker, amplifier_name, test_file, output_dir,
+                                                   file_seed(seed, test_file.stem), run_id,
+                                                   (mutation_stats or {}).get(test_file.stem.split('-amplified')[0]))
+                   for test_file in test_files}
+        for test_name, future in futures.items():
+            try:
+                results[test_name], manifest, profile_records = future.result()
+                manifests.append(manifest)
+                add_records(profile_records)
+            except Exception as e:
+                print(f"LOGGER: amplification failed for {test_name}: {e!r}")
+
+    manifest_path = manifest_path or output_dir.parent / f"{output_dir.name}_manifest.json"
+    write_manifest(merge_manifests(run_id, manifests), manifest_path)
+
+    return results
+
+
+AMPLIFIER = "genetic"
+SEED = 0
+NUM_WORKERS = None  # None uses all cores
+PROFILE = False  # time and memory per stage and contract, see profiling.py
+
+if __name__ == "__main__":
+    if PROFILE:
+        profiling.enable_profiling()
+
+    if AMPLIFIER == "genetic":
+        input_dir, output_base = genetic_search_amplifier.generation_dirs(genetic_search_amplifier.GENERATION)
+    else:
+        input_dir = Path(__file__).parent / "test/test_generated"
+        output_base = Path(__file__).parent / "test/random_search"
+
+    amplified = parallel_amplification(AMPLIFIER, input_dir, output_base, seed=SEED, workers=NUM_WORKERS)
+    print(f"LOGGER: amplified {len(amplified)} test files")
+
+    if PROFILE:
+        profiling.write_profile(output_base.parent / f"{output_base.name}_profile.json")
+        profiling.write_chrome_trace(output_base.parent / f"{output_base.name}_trace.json")
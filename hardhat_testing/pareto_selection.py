@@ -0,0 +1,77 @@
+from coverage_bitsets import union, count
+
+# objectives of a suite: its coverage is maximized, its cost (runtime and number of tests) is minimized
+
+
+def suite_objectives(test_names: list, per_test: dict) -> dict:
+    """
+    :param per_test: test name -> dict with the bitset of its coverage ('bits') and its duration in ms, see
+                     suite_minimization.collect_test_coverage
+    """
+    return {
+        "tests": list(test_names),
+        "coverage": count(union(per_test[name]["bits"] for name in test_names)),
+        "runtime_ms": sum(per_test[name]["duration"] for name in test_names),
+        "size": len(test_names),
+    }
+
+
+def dominates(suite: dict, other: dict) -> bool:
+    """suite is at least as good as other on every objective and better on one."""
+    better_or_equal = [suite["coverage"] >= other["coverage"], suite["runtime_ms"] <= other["runtime_ms"],
+                       suite["size"] <= other["size"]]
+    strictly_better = [suite["coverage"] > other["coverage"], suite["runtime_ms"] < other["runtime_ms"],
+                       suite["size"] < other["size"]]
+    return all(better_or_equal) and any(strictly_better)
+
+
+def pareto_front(suites: list) -> list:
+    """The suites no other suite dominates, from cheap to expensive. Suites with the same tests count once."""
+    unique = list({tuple(sorted(suite["tests"])): suite for suite in suites}.values())
+    front = [suite for suite in unique if not any(dominates(other, suite) for other in unique)]
+    return sorted(front, key=lambda suite: (suite["runtime_ms"], suite["size"], -suite["coverage"]))
+
+
+def candidate_suites(per_test: dict, greedy_set_cover) -> list:
+    """
+    Suites along the trade-off: every prefix of the greedy set cover, once per unit of cost (a test and a ms of
+    runtime). A prefix is the best coverage the greedy finds for what it costs.
+    :param greedy_set_cover: function(test bitsets, weights) -> chosen tests in order, see suite_minimization
+    """
+    test_bits = {name: test["bits"] for name, test in per_test.items()}
+    weightings = [None, {name: test["duration"] + 1 for name, test in per_test.items()}]
+
+    suites = [suite_objectives([], per_test)]
+    for weights in weightings:
+        chosen = greedy_set_cover(test_bits, weights)
+        suites.extend(suite_objectives(chosen[:size], per_test) for size in range(1, len(chosen) + 1))
+    return suites
+
+
+def select_within_budget(front: list, budget_ms: float) -> dict:
+    """The suite of the front with the most coverage that runs within the budget, the cheapest one on a tie."""
+    affordable = [suite for suite in front if suite["runtime_ms"] <= budget_ms]
+    if not affordable:
+        return suite_objectives([], {})
+    return max(affordable, key=lambda suite: (suite["coverage"], -suite["runtime_ms"], -suite["size"]))
+
+
+def pareto_ranks(objectives: list) -> list:
+    """
+    Non-dominated sorting of individuals: rank 0 is the front, rank 1 the front once rank 0 is left out, ...
+    :param objectives: tuple per individual, every value is maximized
+    """
+    def dominates_tuple(a, b):
+        return all(x >= y for x, y in zip(a, b)) and any(x > y for x, y in zip(a, b))
+
+    ranks = [None] * len(objectives)
+    remaining = set(range(len(objectives)))
+    rank = 0
+    while remaining:
+        front = {idx for idx in remaining
+                 if not any(dominates_tuple(objectives[other], objectives[idx]) for other in remaining)}
+        for idx in front:
+            ranks[idx] = rank
+        remaining -= front
+        rank += 1
+    return ranks
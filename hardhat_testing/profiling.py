@@ -0,0 +1,163 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+# switched on with AMPLIFIER_PROFILE=1 or enable_profiling(), the worker processes inherit it through the environment
+PROFILE_ENV = "AMPLIFIER_PROFILE"
+PROFILING = os.environ.get(PROFILE_ENV) == "1"
+# tracing the allocations makes the amplification a few times slower, timing alone costs next to nothing
+TRACE_MEMORY = os.environ.get(PROFILE_ENV + "_MEMORY", "1") == "1"
+
+# stage that is handed out when profiling is off, entering and leaving it does nothing
+NO_STAGE = nullcontext()
+
+records = []
+records_lock = threading.Lock()
+open_stages = threading.local()
+
+
+def enable_profiling(trace_memory: bool = True):
+    global PROFILING, TRACE_MEMORY
+    PROFILING = True
+    TRACE_MEMORY = trace_memory
+    os.environ[PROFILE_ENV] = "1"
+    os.environ[PROFILE_ENV + "_MEMORY"] = "1" if trace_memory else "0"
+
+
+def disable_profiling():
+    global PROFILING
+    PROFILING = False
+    os.environ.pop(PROFILE_ENV, None)
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+@contextmanager
+def measure_stage(name: str, contract=None):
+    """Measures wall time, CPU time of the thread and peak allocations of one stage, use it through stage()."""
+    stack = getattr(open_stages, "stack", None)
+    if stack is None:
+        stack = open_stages.stack = []
+    if contract is None and stack:
+        contract = stack[-1]["contract"]
+    current_stage = {"contract": contract, "start_memory": 0, "peak": 0}
+
+    if TRACE_MEMORY:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        current, peak = tracemalloc.get_traced_memory()
+        # there is only one peak, the stages that are open keep the peak so far before it is reset for this one
+        for open_stage in stack:
+            open_stage["peak"] = max(open_stage["peak"], peak)
+        tracemalloc.reset_peak()
+        current_stage["start_memory"] = current_stage["peak"] = current
+
+    depth = len(stack)
+    stack.append(current_stage)
+    failed = True
+    start = time.perf_counter_ns()
+    start_cpu = time.thread_time_ns()
+    try:
+        yield
+        failed = False
+    finally:
+        end = time.perf_counter_ns()
+        end_cpu = time.thread_time_ns()
+        stack.pop()
+
+        peak_memory = None
+        if TRACE_MEMORY and tracemalloc.is_tracing():
+            current_stage["peak"] = max(current_stage["peak"], tracemalloc.get_traced_memory()[1])
+            peak_memory = current_stage["peak"] - current_stage["start_memory"]
+            if stack:
+                stack[-1]["peak"] = max(stack[-1]["peak"], current_stage["peak"])
+
+        record = {
+            "stage": name,
+            "contract": contract,
+            "start_us": start // 1000,
+            "wall_s": (end - start) / 1e9,
+            "cpu_s": (end_cpu - start_cpu) / 1e9,
+            "peak_bytes": peak_memory,
+            "depth": depth,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "failed": failed,
+        }
+        with records_lock:
+            records.append(record)
+
+
+def stage(name: str, contract=None):
+    """
+    Context manager that records a stage of the pipeline, e.g. `with stage("parse", test_name):`. Stages can be
+    nested, a nested stage belongs to the contract of the stage around it.
+    :param contract: name of the contract (test file) the stage works on
+    """
+    if not PROFILING:
+        return NO_STAGE
+    return measure_stage(name, contract)
+
+
+def take_records() -> list:
+    """Records of this process since the last call, the worker processes send them back this way."""
+    with records_lock:
+        taken = records[:]
+        records.clear()
+    return taken
+
+
+def add_records(new_records: list):
+    with records_lock:
+        records.extend(new_records)
+
+
+def summarize(profile_records: list) -> dict:
+    """Totals per stage and per contract and stage: count, wall time, CPU time and the largest peak."""
+
+    def add(totals, record):
+        total = totals.setdefault(record["stage"], {"count": 0, "wall_s": 0.0, "cpu_s": 0.0, "peak_bytes": None})
+        total["count"] += 1
+        total["wall_s"] += record["wall_s"]
+        total["cpu_s"] += record["cpu_s"]
+        if record["peak_bytes"] is not None:
+            total["peak_bytes"] = max(total["peak_bytes"] or 0, record["peak_bytes"])
+
+    stages = {}
+    contracts = {}
+    for record in profile_records:
+        add(stages, record)
+        if record["contract"] is not None:
+            add(contracts.setdefault(record["contract"], {}), record)
+    return {"stages": stages, "contracts": contracts}
+
+
+def write_profile(path: Path, profile_records: list = None):
+    """JSON with every record and the summary, by default of all records of this process."""
+    profile_records = records if profile_records is None else profile_records
+    with records_lock:
+        profile_records = list(profile_records)
+    path.write_text(json.dumps({"summary": summarize(profile_records), "records": profile_records}, indent=2),
+                    encoding="utf-8")
+
+
+def write_chrome_trace(path: Path, profile_records: list = None):
+    """The records in the Chrome trace format, open it in chrome://tracing or https://ui.perfetto.dev."""
+    profile_records = records if profile_records is None else profile_records
+    with records_lock:
+        profile_records = list(profile_records)
+    events = [{
+        "name": record["stage"],
+        "cat": record["contract"] or "run",
+        "ph": "X",
+        "ts": record["start_us"],
+        "dur": int(record["wall_s"] * 1e6),
+        "pid": record["pid"],
+        "tid": record["tid"],
+        "args": {"contract": record["contract"], "cpu_s": record["cpu_s"], "peak_bytes": record["peak_bytes"]},
+    } for record in profile_records]
+    path.write_text(json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}), encoding="utf-8")
@@ -0,0 +1,80 @@
+from pathlib import Path
+
+from disable_failed_tests_script import skip_tests_in_place
+from genetic_search_amplifier import run_hardhat_test
+from test_results import clear_test_results, load_test_results, failing_tests_by_file
+
+HARDHAT_DIR = Path(__file__).parent
+# a test that only failed because it ran after a failing one can fail again once that one is skipped, a few rounds
+# are enough in practice
+MAX_ROUNDS = 10
+
+
+def run_test_files(test_dir: Path, test_files: list) -> list:
+    """
+    Run the coverage on some test files of test_dir only, the same run as the fitness evaluation.
+    :return: results of the tests, see test_results.load_test_results
+    """
+    paths = [(test_dir / test_file).relative_to(HARDHAT_DIR).as_posix() for test_file in test_files]
+    testfiles = paths[0] if len(paths) == 1 else "{" + ",".join(paths) + "}"
+
+    clear_test_results()
+    run_hardhat_test(testfiles=testfiles)
+    results = load_test_results()
+    if results is None:
+        raise RuntimeError(f"no test results for {testfiles}, see the Hardhat output")
+    return results
+
+
+def prune_failing_tests(test_dir: Path, test_files: list = None, run=run_test_files,
+                        max_rounds: int = MAX_ROUNDS) -> dict:
+    """
+    Run test files, skip their failing tests in place and run the changed files again, until none of their tests
+    fail. Skipping a test can make the next ones fail when they depended on its state, so one round is not always
+    enough. Stops as well when the same tests keep failing, then skipping them had no effect.
+    :param test_files: names of the files of test_dir to run first, all of them when None
+    :param run: function(test_dir, test_files) that runs the files and returns their results
+    :return: the skipped test numbers per file
+    """
+    if test_files is None:
+        test_files = sorted(f.name for f in test_dir.glob("*.js"))
+    if not test_files:
+        return {}
+    failing_tests = failing_tests_by_file(run(test_dir, sorted(test_files)))
+
+    skipped = {}
+    previous_failing = None
+    for prune_round in range(1, max_rounds + 1):
+        failing = {test_file: sorted(tests) for test_file, tests in failing_tests.items() if tests}
+        if not failing:
+            print(f"LOGGER: no failing tests left after {prune_round - 1} rounds")
+            break
+        if failing == previous_failing:
+            print(f"LOGGER: the same {sum(len(tests) for tests in failing.values())} tests keep failing, stopped")
+            break
+
+        # every file is rewritten once per round, with all its failing tests at the same time
+        changed = [test_file for test_file, tests in failing.items()
+                   if skip_tests_in_place(str(test_dir / test_file), tests)]
+        for test_file, tests in failing.items():
+            skipped_tests = skipped.setdefault(test_file, [])
+            skipped_tests += [test for test in tests if test not in skipped_tests]
+        print(f"LOGGER: round {prune_round}, skipped {sum(len(tests) for tests in failing.values())} tests "
+              f"in {len(failing)} files")
+        if not changed:
+            break
+
+        previous_failing = failing
+        # only the files that changed can have new failures
+        failing_tests = failing_tests_by_file(run(test_dir, sorted(changed)))
+    else:
+        print(f"LOGGER: still failing tests after {max_rounds} rounds")
+
+    return skipped
+
+
+TEST_DIR = HARDHAT_DIR / "test/genetic_search/success_generation1"
+
+if __name__ == "__main__":
+    pruned = prune_failing_tests(TEST_DIR)
+    print(f"LOGGER: skipped {sum(len(tests) for tests in pruned.values())} tests in {len(pruned)} files")
@@ -5,6 +5,13 @@ import time
 import os
 from pprint import pprint
 
+from expansion_strategies import expansion_modes, EXPANSION_CAP
+from js_scanner import scan_blocks, block_body
+from profiling import stage
+from test_numbering import new_numbering, number_test
+
+EXPANSION_STRATEGY = "full"  # "full", "pairwise" or "random", see expansion_strategies.py
+
 
 def run_hardhat_test():
     """Run Hardhat tests and return the coverage report."""
@@ -93,16 +100,20 @@ def generate_test_signature(test_case: list, test_name: str):
     test_signature += r'  });'
     return test_signature
 
-counter = 0
-def assemble_test_cases(all_tests: list):
-    full_test_file = ""
-    global counter
-    for test in all_tests:
-        counter += 1
-        test_name = f"test {counter}"
-        full_test_file += generate_test_signature(test_case=test, test_name=test_name)
-        full_test_file += '\n\n'
-    return full_test_file
+def stream_test_cases(all_tests, numbering=None, scope: str = ""):
+    """
+    Render the tests one by one, all_tests can be a generator so they never all have to be in memory.
+    :param all_tests: (origin, statements) tuples, origin is the original test it is derived from
+    :param numbering: numbering of the run (see test_numbering.py), a new one that starts at 'test 1' if None
+    :param scope: test file the tests are written to
+    """
+    numbering = numbering or new_numbering()
+    for origin, test in all_tests:
+        test_name = number_test(numbering, scope, origin)
+        yield generate_test_signature(test_case=test, test_name=test_name) + '\n\n'
+
+def assemble_test_cases(all_tests: list, numbering=None, scope: str = ""):
+    return "".join(stream_test_cases(all_tests, numbering, scope))
 
 def remove_unnecessary_describe_sections(full_test: str) -> str:
     """
@@ -126,6 +137,40 @@ def remove_unnecessary_describe_sections(full_test: str) -> str:
 
     return processed_full_test
 
+def write_full_test_file(output_path, test_blocks, original_test: str):
+    """
+    Streaming version of assemble_full_test_file: the rendered test blocks are written to the file as they come in,
+    through a buffered writer, with the same describe sections removed as remove_unnecessary_describe_sections.
+    :param output_path: file to write the full test to
+    :param test_blocks: iterable of rendered 'it(...)' blocks (see stream_test_cases)
+    :param original_test: original test, its header (everything before the first test) is reused
+    """
+    if 'it("' not in original_test:
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(original_test)
+        return
+
+    def chunks():
+        yield original_test.split('it("')[0]
+        yield "\n"
+        yield from test_blocks
+        yield '});'
+
+    with open(output_path, "w", encoding="utf-8", buffering=1 << 16) as f:
+        describe_seen = False
+        pending = ""
+        for chunk in chunks():
+            lines = (pending + chunk).split('\n')
+            pending = lines.pop()  # the last part isn't a full line yet
+            for line in lines:
+                if 'describe("' in line:
+                    if describe_seen:
+                        continue
+                    describe_seen = True
+                f.write(line + '\n')
+        if not ('describe("' in pending and describe_seen):
+            f.write(pending + '\n')
+
 def assemble_full_test_file(all_test_cases: str, original_test: str):
     full_test = ""
     if 'it("' in original_test:
@@ -162,6 +207,39 @@ def update_test_case_expectancy(test_case: str):
         else:
             return 'expect(' + test_case + ').to.be.ok;'
 
+def expand_test_case(test_case: list, new_test_cases: list, strategy=EXPANSION_STRATEGY, cap=EXPANSION_CAP):
+    """
+    Yield the versions of a mutated test one at a time. Every mutated line either keeps its assertion or gets it
+    updated (update_test_case_expectancy), which combinations are made depends on the strategy (see
+    expansion_strategies.py), 'full' is the original expansion into all 2**mutated lines versions.
+    """
+    mutated_lines = [i for i in range(len(test_case)) if test_case[i] != new_test_cases[i]]
+    updated_lines = {i: update_test_case_expectancy(new_test_cases[i]) for i in mutated_lines}
+
+    for modes in expansion_modes(len(mutated_lines), strategy, cap):
+        keep_assertion = dict(zip(mutated_lines, modes))
+        expanded_test_case = []
+        for i in range(len(test_case)):
+            if i not in keep_assertion:
+                expanded_test_case.append(test_case[i])
+            elif keep_assertion[i]:
+                expanded_test_case.append(new_test_cases[i])
+            else:
+                expanded_test_case.append(updated_lines[i])
+        yield expanded_test_case
+
+def generate_amplified_tests(original_test_cases: list, iterations=10, strategy=EXPANSION_STRATEGY, cap=EXPANSION_CAP):
+    """
+    Generator over all amplified tests, they are mutated and expanded only when they are asked for.
+    :return: (origin, statements) tuples, origin is the original test ('original 1', ...) it is derived from
+    """
+    for it in range(iterations):
+        for idx, test_case in enumerate(original_test_cases, start=1):
+            new_test_cases = [make_smart_mutation(test_case_line) for test_case_line in test_case]
+
+            for expanded_test_case in expand_test_case(test_case, new_test_cases, strategy, cap):
+                yield f"original {idx}", expanded_test_case
+
 def random_search_amplification(original_test_cases: list, test_name, iterations=10):
     """Perform random search to amplify the test case."""
 
@@ -176,45 +254,6 @@ def random_search_amplification(original_test_cases: list, test_name, iterations
 
     # Run the tests with Hardhat
     # base_output = run_hardhat_test()
-    all_tests = []
-    for it in range(iterations):
-        for test_case in original_test_cases:
-            new_test_cases = []
-
-            mutation_ctr = 0
-            for test_case_line in test_case:
-
-                mutated_line = make_smart_mutation(test_case_line)
-                new_test_cases.append(mutated_line)
-                if mutated_line != test_case_line:
-                    mutation_ctr += 1
-
-            new_test_cases_expanded = [[] for _ in range(2**mutation_ctr)]
-            n = len(new_test_cases_expanded)
-            alternation = 1
-            alternation_ctr = 0
-            mode = True
-            for i in range(len(test_case)):
-                if test_case[i] == new_test_cases[i]:
-                    for j in range(n):
-                        new_test_cases_expanded[j].append(test_case[i])
-                else:
-                    for j in range(n):
-                        if alternation == alternation_ctr:
-                            alternation_ctr = 0
-                            mode = not mode  # true to false or vice versa
-                        else:
-                            alternation_ctr += 1
-
-                        if mode:
-                            new_test_cases_expanded[j].append(new_test_cases[i])
-                        else:
-                            new_test_cases_expanded[j].append(update_test_case_expectancy(new_test_cases[i]))
-
-                    alternation *= 2
-                    alternation_ctr = 0
-
-            all_tests.extend(new_test_cases_expanded)
 
     filename = f"test_file_{test_name}.js"
     # filenames.append(filename)
@@ -233,18 +272,18 @@ def random_search_amplification(original_test_cases: list, test_name, iterations
     # pprint(original_coverage)
     # pprint(coverages)
 
-    full_test = assemble_test_cases(all_tests)
+    full_test = assemble_test_cases(generate_amplified_tests(original_test_cases, iterations))
 
     return full_test
 
 def extract_test_cases(test_code):
-    pattern = r'it\((?:.|\n)*?\{((?:.|\n)*?)^\s*\}\);'
-    matches = re.finditer(pattern, test_code, re.MULTILINE)
-
     test_cases = []
-    for match in matches:
-        test_body = match.group(1).strip()
-        lines = [line.strip() for line in test_body.split('\n') if line.strip()]
+    for block in scan_blocks(test_code):
+        # skipped tests (it.skip) failed before, they are not amplified
+        test_body = block_body(test_code, block) if block["kind"] == "it" else None
+        if test_body is None:
+            continue
+        lines = [line.strip() for line in test_body.strip().split('\n') if line.strip()]
         test_cases.append(lines)
 
     return test_cases
@@ -266,17 +305,21 @@ def post_process_test_cases(test_cases):
                 line = line[:comment_match.start()]
             return line.rstrip()
 
-        def brackets_balanced(s):
-            stack = []
+        # brackets that are still open in the buffer, only the new part of the buffer is scanned every line
+        open_brackets = []
+        mismatched = False
+
+        def update_brackets(s):
+            """Push and pop the brackets of s, returns False if a closing bracket doesn't match."""
             pairs = {')': '(', ']': '[', '}': '{'}
             for c in s:
                 if c in "([{":
-                    stack.append(c)
+                    open_brackets.append(c)
                 elif c in ")]}":
-                    if not stack or stack[-1] != pairs[c]:
+                    if not open_brackets or open_brackets[-1] != pairs[c]:
                         return False
-                    stack.pop()
-            return len(stack) == 0
+                    open_brackets.pop()
+            return True
 
         for line in test_case:
             clean_line = strip_comment_and_whitespace(line)
@@ -296,14 +339,17 @@ def post_process_test_cases(test_cases):
                 # it belongs to the previous line, which is in the buffer
                 else:
                     buffer += clean_line
+                    mismatched = mismatched or not update_brackets(clean_line)
                 continue
 
             if buffer:
                 buffer += " " + clean_line
             else:
                 buffer = clean_line
+            # a mismatch stays in the buffer, so the buffer can't get balanced anymore after it
+            mismatched = mismatched or not update_brackets(clean_line)
 
-            if brackets_balanced(buffer):
+            if not mismatched and not open_brackets:
                 merged_lines.append(buffer.strip())
                 buffer = ""
 
@@ -590,6 +636,44 @@ it("Should not allow transferFrom if allowance is insufficient", async function
 NUM_ITERATIONS = 5
 test_names_to_skip = ["2018-14084-test", "2018-17071-test", "2018-17877-test", "2018-19831-test"]
 
+
+def amplify_test_file(test_file, output_base, iterations=NUM_ITERATIONS, strategy=EXPANSION_STRATEGY, numbering=None):
+    """
+    Amplify a single test file 'iterations' times, every amplified version is written to its own file.
+    :param test_file: Path of the JS test file to amplify
+    :param output_base: Path of the folder in which a subfolder per test is made
+    :param iterations: number of amplified versions to write
+    :param strategy: how the mutated tests are expanded, see expansion_strategies.py
+    :param numbering: numbering of the run (see test_numbering.py), the tests of this file start at 'test 1' and
+                      keep counting over the amplified versions
+    :return: list with the Paths of the amplified test files
+    """
+    test_name = test_file.stem  # 'ArithmeticTest' zonder '.js'
+    current_test = test_file.read_text(encoding="utf-8")
+
+    test_output_dir = output_base / test_name
+    test_output_dir.mkdir(exist_ok=True)
+
+    # the original test only has to be parsed once for all iterations
+    with stage("parse", test_name):
+        original_test_cases = post_process_test_cases(extract_test_cases(test_code=current_test))
+
+    numbering = numbering or new_numbering()
+    output_paths = []
+    for nr in range(1, iterations+1):
+        # the amplified tests are streamed straight into the file, so memory doesn't grow with the expansion
+        amplified_tests = generate_amplified_tests(original_test_cases, iterations=1, strategy=strategy)
+
+        output_path = test_output_dir / f"{test_name}-amplified-{nr}.js"
+        # generating and writing are interleaved, so they are measured together
+        with stage("generate and write", test_name):
+            write_full_test_file(output_path, stream_test_cases(amplified_tests, numbering, test_name),
+                                 original_test=current_test)
+        output_paths.append(output_path)
+
+    return output_paths
+
+
 if __name__ == "__main__":
     from pathlib import Path
 
@@ -603,21 +687,4 @@ if __name__ == "__main__":
             print("SKIPPING:", test_name)
             continue
 
-        current_test = test_file.read_text(encoding="utf-8")
-
-        test_output_dir = output_base / test_name
-        test_output_dir.mkdir(exist_ok=True)
-
-        for nr in range(1, NUM_ITERATIONS+1):
-            amplified_test = random_search_amplification(post_process_test_cases(extract_test_cases(test_code=current_test)), test_name, iterations=1)
-
-            amplified = assemble_full_test_file(all_test_cases=amplified_test, original_test=current_test)
-
-            output_path = test_output_dir / f"{test_name}-amplified-{nr}.js"
-            output_path.write_text(amplified, encoding="utf-8")
-
-
-
-
-
-
+        amplify_test_file(test_file, output_base)
@@ -1,36 +1,17 @@
-import os
-import re
+from pathlib import Path
 from pprint import pprint
 
+from test_rewriter import rename_all_tests
+
 # Pad naar je testfolder
 test_folder = "test"
 
 def rename_tests(test_dir):
-    test_counter = 1  # Start from test 1
-
-    # Regex to match test names: it("some description", or it('some description',
-    test_pattern = re.compile(r'it\((["\'])(.*?)(\1)')
-
-    for filename in sorted(os.listdir(test_dir)):
-        if filename.endswith('.js'):
-            filepath = os.path.join(test_dir, filename)
-            with open(filepath, 'r', encoding='utf-8') as f:
-                content = f.read()
-
-            def replace_test_name(match):
-                # global test_counter
-                nonlocal test_counter
-                new_name = f'test {test_counter}'
-                test_counter += 1
-                return f'it("{new_name}"'
-
-            # Replace test names with incrementing names
-            content = re.sub(test_pattern, replace_test_name, content)
-
-            # Write back to file (overwrite)
-            # write_filepath = os.path.join(destination_filepath, filename)
-            with open(filepath, "w", encoding="utf-8") as file:
-                file.write(content)
+    """
+    Rename the tests of all files in test_dir to 'test 1', 'test 2', ... counting on over the files in the order
+    of their names. The files are rewritten at the same time, see test_rewriter.rename_all_tests.
+    """
+    return rename_all_tests(Path(test_dir))
 
 # def rename_tests(destination_filepath: str, current_test_folder: str):
 #     # Doorloop alle .js-bestanden in de map
@@ -68,5 +49,6 @@ def rename_tests(test_dir):
 #             break
 
 
-# find_failing_tests("full_output_rs.txt")
-rename_tests("test")
+if __name__ == "__main__":
+    # find_failing_tests("full_output_rs.txt")
+    rename_tests("test")
@@ -0,0 +1,283 @@
+import copy
+import json
+import os
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from evaluation_cache import evaluation_key, load_evaluation, store_evaluation
+from profiling import stage
+from test_results import load_test_results, failing_tests_by_file
+
+HARDHAT_DIR = Path(__file__).parent
+SHARD_BASE = HARDHAT_DIR / "coverage_shards"
+
+
+def contract_of_test(test_file: Path, contract_files: dict):
+    """'2018-11429-test-amplified-3.js' -> contracts/2018-11429.sol, None if no contract with that name exists."""
+    return contract_files.get(test_file.stem.split('-test')[0])
+
+
+def group_tests(test_files: list, contract_files: list):
+    """
+    Link every test to the contract it tests.
+    :return: dict that maps every contract on its tests (possibly none), and the list of tests without a contract
+    """
+    contracts_by_name = {contract.stem: contract for contract in contract_files}
+    tests_per_contract = {contract: [] for contract in contract_files}
+    unlinked_tests = []
+    for test_file in test_files:
+        contract = contract_of_test(test_file, contracts_by_name)
+        if contract is None:
+            unlinked_tests.append(test_file)
+        else:
+            tests_per_contract[contract].append(test_file)
+    return tests_per_contract, unlinked_tests
+
+
+def make_shards(tests_per_contract: dict, unlinked_tests: list, contract_files: list, num_shards: int) -> list:
+    """
+    Split the tests and contracts over num_shards shards. All tests of a contract go to the same shard, so every
+    contract is only measured once, and the biggest contracts are divided first so the shards stay balanced.
+    Tests that can't be linked to a contract get all contracts, contracts without tests are still compiled
+    somewhere so they show up in the report just like in a normal run.
+    :param tests_per_contract: the contracts to run with their tests (see group_tests)
+    :param unlinked_tests: tests without a contract
+    :param contract_files: all contracts, they are given to the shard with the unlinked tests
+    :return: list of {"tests": [...], "contracts": [...]} dicts
+    """
+    shards = [{"tests": [], "contracts": [], "size": 0} for _ in range(max(1, num_shards))]
+
+    # longest processing time first: the test size is used as a guess of how long the contract takes to run
+    def contract_size(contract):
+        return sum(test_file.stat().st_size for test_file in tests_per_contract[contract])
+
+    for contract in sorted(tests_per_contract, key=contract_size, reverse=True):
+        shard = min(shards, key=lambda s: s["size"])
+        shard["contracts"].append(contract)
+        shard["tests"].extend(tests_per_contract[contract])
+        shard["size"] += contract_size(contract)
+
+    if unlinked_tests:
+        shards.append({"tests": unlinked_tests, "contracts": list(contract_files), "size": 0})
+
+    return [{"tests": shard["tests"], "contracts": shard["contracts"]} for shard in shards if shard["tests"] or
+            shard["contracts"]]
+
+
+def prepare_shard_dir(shard: dict, shard_dir: Path, test_dir: Path):
+    """
+    Build the worker directory of a shard, it gets its own config, contracts, tests, cache and artifacts. The tests
+    keep their subfolder of test_dir, generations have test files with the same name.
+    """
+    if shard_dir.exists():
+        shutil.rmtree(shard_dir)
+    (shard_dir / "contracts").mkdir(parents=True)
+    (shard_dir / "test").mkdir()
+
+    # paths in the config are relative, so cache and artifacts end up inside the shard directory.
+    # node_modules is found in the parent folder by the node module resolution
+    for config_file in ["hardhat.config.js", "solc_cache.js", "mocha_results_reporter.js"]:
+        shutil.copy(HARDHAT_DIR / config_file, shard_dir / config_file)
+    for contract in shard["contracts"]:
+        shutil.copy(contract, shard_dir / "contracts" / contract.name)
+    for test_file in shard["tests"]:
+        shard_test_file = shard_dir / "test" / test_file.relative_to(test_dir)
+        shard_test_file.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy(test_file, shard_test_file)
+
+
+def failing_tests_per_file(shard_dir: Path) -> dict:
+    """
+    Failing test numbers per test file of a shard, by its path relative to the test folder, from the mocha results
+    of its run (see test_results.py).
+    """
+    results = load_test_results(shard_dir)
+    if results is None:
+        print(f"LOGGER: could not read the test results of {shard_dir.name}")
+        return {}
+    return failing_tests_by_file(results, test_dir="test")
+
+
+def run_shard(shard_dir: Path) -> dict:
+    """
+    Run the Hardhat coverage of a single shard.
+    :return: dict with the console output, the coverage-final.json and the failing tests per test file
+    """
+    with stage("hardhat", shard_dir.name):
+        result = subprocess.run(
+            ["wsl", "npx", "hardhat", "coverage"],
+            capture_output=True, text=True, encoding='utf-8', cwd=shard_dir
+        )
+    (shard_dir / "output.txt").write_text(result.stdout, encoding="utf-8")
+
+    coverage_path = shard_dir / "coverage" / "coverage-final.json"
+    if not coverage_path.exists():
+        print(f"LOGGER: no coverage report for {shard_dir.name}")
+        return {"output": result.stdout, "coverage": {}, "failing_tests": {}}
+
+    with open(coverage_path, "r", encoding="utf-8") as f:
+        coverage = json.load(f)
+    return {"output": result.stdout, "coverage": coverage,
+            "failing_tests": failing_tests_per_file(shard_dir)}
+
+
+def merge_coverage(shard_coverages: list) -> dict:
+    """
+    Merge the coverage-final.json of every shard into one report in the same format. The hit counts of a contract
+    that was instrumented in several shards are summed, the maps are the same in every shard.
+    :param shard_coverages: list of (shard directory name, coverage-final.json content) tuples
+    :return: merged coverage-final.json content
+    """
+    merged = {}
+    for shard_name, coverage in shard_coverages:
+        for file_key, metrics in coverage.items():
+            if file_key not in merged:
+                merged[file_key] = copy.deepcopy(metrics)
+                # point back to the contract in the main folder instead of the copy in the shard
+                merged[file_key]["path"] = metrics["path"].replace(f"/{SHARD_BASE.name}/{shard_name}/", "/")
+                continue
+
+            merged_metrics = merged[file_key]
+            for metric in ["s", "f", "l"]:
+                for key, hits in metrics.get(metric, {}).items():
+                    merged_metrics[metric][key] = merged_metrics[metric].get(key, 0) + hits
+            for key, hits in metrics.get("b", {}).items():
+                merged_metrics["b"][key] = [h1 + h2 for h1, h2 in zip(merged_metrics["b"].get(key, [0] * len(hits)),
+                                                                      hits)]
+    return merged
+
+
+def write_lcov(coverage: dict, lcov_path: Path):
+    """Write the lcov.info of a coverage-final.json, in the same layout as the one solidity-coverage writes."""
+    lines = []
+    for metrics in coverage.values():
+        lines.append("TN:")
+        lines.append(f"SF:{metrics['path']}")
+
+        functions = metrics.get("fnMap", {})
+        function_hits = metrics.get("f", {})
+        for key, function in functions.items():
+            lines.append(f"FN:{function['line']},{function['name']}")
+        lines.append(f"FNF:{len(functions)}")
+        lines.append(f"FNH:{sum(1 for key in functions if function_hits.get(key, 0) > 0)}")
+        for key, function in functions.items():
+            lines.append(f"FNDA:{function_hits.get(key, 0)},{function['name']}")
+
+        line_hits = metrics.get("l", {})
+        for line, hits in line_hits.items():
+            lines.append(f"DA:{line},{hits}")
+        lines.append(f"LF:{len(line_hits)}")
+        lines.append(f"LH:{sum(1 for hits in line_hits.values() if hits > 0)}")
+
+        branches = metrics.get("branchMap", {})
+        branch_hits = metrics.get("b", {})
+        branch_total = 0
+        branch_hit = 0
+        for key, branch in branches.items():
+            for idx, hits in enumerate(branch_hits.get(key, [])):
+                lines.append(f"BRDA:{branch['line']},{key},{idx},{hits}")
+                branch_total += 1
+                branch_hit += 1 if hits > 0 else 0
+        lines.append(f"BRF:{branch_total}")
+        lines.append(f"BRH:{branch_hit}")
+        lines.append("end_of_record")
+
+    lcov_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def sharded_coverage(test_dir: Path, contracts_dir: Path = HARDHAT_DIR / "contracts", num_shards=None,
+                     use_cache: bool = True) -> dict:
+    """
+    Run the Hardhat coverage of all tests in test_dir split over shards that run at the same time, and merge the
+    reports into coverage.json, coverage/coverage-final.json and coverage/lcov.info like a normal run would.
+    Contracts whose source, tests and compiler settings didn't change since an earlier run get their cached result
+    back and are not run again.
+    :param test_dir: folder with the JS tests, subfolders included
+    :param contracts_dir: folder with the contracts
+    :param num_shards: number of shards, defaults to the number of cores
+    :param use_cache: reuse and store results in the evaluation cache (see evaluation_cache.py)
+    :return: dict with the console output per shard, the merged coverage, the failing tests per test file (by its
+             path relative to test_dir) and the contracts that came from the cache
+    """
+    contract_files = sorted(contracts_dir.glob("*.sol"))
+    tests_per_contract, unlinked_tests = group_tests(sorted(test_dir.rglob("*.js")), contract_files)
+
+    cached_results = {}
+    keys = {}
+    if use_cache:
+        for contract, test_files in tests_per_contract.items():
+            keys[contract] = evaluation_key(contract, test_files, test_dir=test_dir)
+            cached_result = load_evaluation(keys[contract])
+            if cached_result is not None:
+                cached_results[contract] = cached_result
+    contracts_to_run = {contract: test_files for contract, test_files in tests_per_contract.items()
+                        if contract not in cached_results}
+    print(f"LOGGER: {len(cached_results)} contracts from the cache, {len(contracts_to_run)} contracts to run")
+
+    shards = []
+    if contracts_to_run or unlinked_tests:
+        shards = make_shards(contracts_to_run, unlinked_tests, contract_files, num_shards or os.cpu_count())
+
+    shard_dirs = []
+    for idx, shard in enumerate(shards):
+        shard_dir = SHARD_BASE / f"shard{idx}"
+        prepare_shard_dir(shard, shard_dir, test_dir)
+        shard_dirs.append(shard_dir)
+
+    # every shard is its own Hardhat process, threads are enough to wait on them
+    results = []
+    if shard_dirs:
+        with ThreadPoolExecutor(max_workers=len(shard_dirs)) as executor:
+            results = list(executor.map(run_shard, shard_dirs))
+
+    shard_coverages = [("cache", cached_result["coverage"]) for cached_result in cached_results.values()]
+    shard_coverages += [(shard_dir.name, result["coverage"]) for shard_dir, result in zip(shard_dirs, results)]
+    merged = merge_coverage(shard_coverages)
+
+    failing_tests = {}
+    for cached_result in cached_results.values():
+        failing_tests.update(cached_result["failing_tests"])
+    for result in results:
+        failing_tests.update(result["failing_tests"])
+
+    if use_cache:
+        # only contracts that were really measured are stored, a shard that crashed has no coverage for them
+        # the coverage comes from the shard of the contract itself, the shard with the unlinked tests runs again
+        # every time and would otherwise be counted twice
+        for shard, shard_dir, result in zip(shards, shard_dirs, results):
+            for contract in shard["contracts"]:
+                if contract not in contracts_to_run or contract.name not in coverage_by_contract(result["coverage"]):
+                    continue
+                test_names = [test_file.relative_to(test_dir).as_posix() for test_file in contracts_to_run[contract]]
+                if test_names and not any(name in result["failing_tests"] for name in test_names):
+                    continue  # the test results couldn't be read, so there is nothing trustworthy to store
+                store_evaluation(keys[contract], {
+                    "coverage": merge_coverage([(shard_dir.name, {
+                        file_key: metrics for file_key, metrics in result["coverage"].items()
+                        if os.path.basename(file_key) == contract.name})]),
+                    "failing_tests": {name: failing for name, failing in result["failing_tests"].items()
+                                      if name in test_names},
+                })
+
+    (HARDHAT_DIR / "coverage").mkdir(exist_ok=True)
+    for coverage_path in [HARDHAT_DIR / "coverage.json", HARDHAT_DIR / "coverage" / "coverage-final.json"]:
+        with open(coverage_path, "w", encoding="utf-8") as f:
+            json.dump(merged, f)
+    write_lcov(merged, HARDHAT_DIR / "coverage" / "lcov.info")
+
+    return {"outputs": {shard_dir.name: result["output"] for shard_dir, result in zip(shard_dirs, results)},
+            "coverage": merged,
+            "failing_tests": failing_tests,
+            "cached": [contract.name for contract in cached_results]}
+
+
+def coverage_by_contract(coverage: dict) -> set:
+    return {os.path.basename(file_key) for file_key in coverage}
+
+
+NUM_SHARDS = None  # None uses all cores
+
+if __name__ == "__main__":
+    sharded_coverage(HARDHAT_DIR / "test", num_shards=NUM_SHARDS)
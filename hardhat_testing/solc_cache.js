@@ -0,0 +1,58 @@
+// Content-addressed cache of the solc output, shared by the project, the coverage shards and the test workers.
+// Every fresh shard or worker folder would otherwise run solc again for all contracts and all 7 compiler versions.
+const crypto = require("crypto");
+const fs = require("fs");
+const path = require("path");
+const { subtask } = require("hardhat/config");
+const {
+  TASK_COMPILE_SOLIDITY_RUN_SOLC,
+  TASK_COMPILE_SOLIDITY_RUN_SOLCJS,
+} = require("hardhat/builtin-tasks/task-names");
+
+// shards and workers live in subfolders of the project, the folder with package.json is the shared one
+function projectRoot(dir) {
+  let current = dir;
+  while (!fs.existsSync(path.join(current, "package.json"))) {
+    const parent = path.dirname(current);
+    if (parent === current) return dir;
+    current = parent;
+  }
+  return current;
+}
+
+const CACHE_DIR = process.env.SOLC_CACHE_DIR || path.join(projectRoot(__dirname), "solc_cache");
+
+function cacheKey(compilerPath, input) {
+  // the compiler file name holds the exact version, the input holds the sources and the optimizer settings
+  return crypto
+    .createHash("sha256")
+    .update(path.basename(compilerPath))
+    .update(JSON.stringify(input))
+    .digest("hex");
+}
+
+async function cachedCompile(compilerPath, input, compile) {
+  const cachePath = path.join(CACHE_DIR, `${cacheKey(compilerPath, input)}.json`);
+  if (fs.existsSync(cachePath)) {
+    return JSON.parse(fs.readFileSync(cachePath, "utf8"));
+  }
+
+  const output = await compile();
+  const hasErrors = (output.errors || []).some((error) => error.severity === "error");
+  if (!hasErrors) {
+    // write and rename, so a shard that reads at the same time never sees half an output
+    fs.mkdirSync(CACHE_DIR, { recursive: true });
+    const tmpPath = `${cachePath}.${process.pid}.tmp`;
+    fs.writeFileSync(tmpPath, JSON.stringify(output));
+    fs.renameSync(tmpPath, cachePath);
+  }
+  return output;
+}
+
+subtask(TASK_COMPILE_SOLIDITY_RUN_SOLC).setAction(async (args, _, runSuper) =>
+  cachedCompile(args.solcPath, args.input, () => runSuper(args)),
+);
+
+subtask(TASK_COMPILE_SOLIDITY_RUN_SOLCJS).setAction(async (args, _, runSuper) =>
+  cachedCompile(args.solcJsPath, args.input, () => runSuper(args)),
+);
@@ -0,0 +1,226 @@
+import heapq
+import re
+import shutil
+from pathlib import Path
+
+from coverage_bitsets import (new_coverage_index, add_to_index, coverage_bits, union, difference, count,
+                              save_bitsets, load_bitsets)
+from hardhat_worker_pool import start_worker_pool, run_on_pool, stop_worker_pool
+from js_scanner import scan_blocks
+from pareto_selection import candidate_suites, pareto_front, select_within_budget
+from test_rewriter import skip_tests, write_atomic
+
+HARDHAT_DIR = Path(__file__).parent
+TEST_NAME_PATTERN = re.compile(r'^test (\d+)$')
+BLANK_LINE_PATTERN = re.compile(r'[ \t]*\n')
+
+
+def greedy_set_cover(test_bits: dict, weights: dict = None) -> list:
+    """
+    Smallest (or cheapest) set of tests that still covers everything the tests cover together. Greedy: every step
+    takes the test with the most uncovered items per unit of weight. The gains only go down, so a test is only
+    recomputed when it comes out of the heap (lazy greedy).
+    :param test_bits: test name -> bitset of its coverage (see coverage_bitsets.py)
+    :param weights: test name -> cost of the test (e.g. its duration), every test costs 1 when None
+    :return: the chosen test names in the order they were chosen
+    """
+    weights = weights or {}
+    uncovered = union(test_bits.values())
+    heap = [(-count(bits) / weights.get(name, 1), order, name)
+            for order, (name, bits) in enumerate(test_bits.items())]
+    heapq.heapify(heap)
+
+    chosen = []
+    while uncovered and heap:
+        _, order, name = heapq.heappop(heap)
+        gain = count(test_bits[name] & uncovered) / weights.get(name, 1)
+        if gain == 0:
+            continue
+        # still the best after recomputing its gain, otherwise back in the heap with the new gain
+        if heap and (-gain, order) > heap[0][:2]:
+            heapq.heappush(heap, (-gain, order, name))
+            continue
+        chosen.append(name)
+        uncovered = difference(uncovered, test_bits[name])
+    return chosen
+
+
+def single_test_files(test_file: Path, work_dir: Path, only: set = None) -> dict:
+    """
+    A copy of the test file per test in which all other tests are skipped, so the describe and beforeEach blocks
+    around the test stay the same.
+    :param only: numbers of the tests that get a copy, all of them when None
+    :return: test number -> Path of its copy
+    """
+    content = test_file.read_text(encoding="utf-8")
+    test_numbers = [int(match.group(1)) for match in re.finditer(r'\bit\(["\']test (\d+)["\']', content)]
+
+    work_dir.mkdir(parents=True, exist_ok=True)
+    copies = {}
+    for test_number in test_numbers:
+        if only is not None and test_number not in only:
+            continue
+        copy_path = work_dir / f"{test_file.stem}-only-{test_number}.js"
+        copy_path.write_text(skip_tests(content, [n for n in test_numbers if n != test_number])[0], encoding="utf-8")
+        copies[test_number] = copy_path
+    return copies
+
+
+def collect_test_coverage(test_file: Path, pool, work_dir: Path, index: dict = None, only: set = None) -> dict:
+    """
+    Run every test of a test file on its own on the Hardhat workers.
+    :param index: coverage index the bitsets are made with, a new one when None
+    :param only: numbers of the tests to run, all of them when None
+    :return: test number -> dict with its state, duration in ms and the bitset of its statements, branch arms and
+             lines (see coverage_bitsets.py)
+    """
+    copies = single_test_files(test_file, work_dir, only)
+    evaluations = run_on_pool(pool, [[copy_path] for copy_path in copies.values()])
+
+    index = new_coverage_index() if index is None else index
+    for evaluation in evaluations:
+        add_to_index(index, evaluation["coverage"])
+    per_test = {}
+    for test_number, evaluation in zip(copies, evaluations):
+        result = next((result for result in evaluation["results"] if result["title"] == f"test {test_number}"),
+                      None)
+        per_test[test_number] = {"state": result["state"] if result else "failed",
+                                 "duration": result["duration"] or 0 if result else 0,
+                                 "bits": coverage_bits(evaluation["coverage"], index)}
+    for copy_path in copies.values():
+        copy_path.unlink()
+    return per_test
+
+
+def load_suite_coverage(path: Path) -> tuple:
+    """
+    Per-test coverage that was stored with save_suite_coverage, tests in it don't have to run on their own again.
+    :return: dict '{test file name}:{test number}' -> dict with the state, duration and bitset of the test, and the
+             index of the bitsets. Empty with a new index when path doesn't exist
+    """
+    if path is None or not path.exists():
+        return {}, new_coverage_index()
+    bitsets, index = load_bitsets(path)
+    return {name: {**index["rows"][name], "bits": bits} for name, bits in bitsets.items()}, index
+
+
+def save_suite_coverage(path: Path, suite_coverage: dict, index: dict):
+    save_bitsets(path, {name: test["bits"] for name, test in suite_coverage.items()}, index,
+                 rows={name: {"state": test["state"], "duration": test["duration"]}
+                       for name, test in suite_coverage.items()})
+
+
+def cached_test_coverage(test_file: Path, pool, work_dir: Path, suite_coverage: dict, index: dict,
+                         only: set = None) -> dict:
+    """
+    collect_test_coverage that only runs the tests that aren't in suite_coverage yet, their coverage is added to it.
+    The tests are recognized by file name and number, so suite_coverage must belong to the same generation.
+    :return: test number -> coverage of the tests of the file (the ones in only when it is given)
+    """
+    content = test_file.read_text(encoding="utf-8")
+    test_numbers = {int(match.group(1)) for match in re.finditer(r'\bit\(["\']test (\d+)["\']', content)}
+    wanted = test_numbers if only is None else test_numbers & set(only)
+    missing = {number for number in wanted if f"{test_file.name}:{number}" not in suite_coverage}
+    if missing:
+        for test_number, test in collect_test_coverage(test_file, pool, work_dir, index, missing).items():
+            suite_coverage[f"{test_file.name}:{test_number}"] = test
+    return {number: suite_coverage[f"{test_file.name}:{number}"] for number in wanted}
+
+
+def remove_tests(content: str, test_numbers: set) -> str:
+    """Remove the `it("test N", ...)` blocks of the given tests from the file, the rest stays as it is."""
+    cuts = []
+    for block in scan_blocks(content):
+        title_match = TEST_NAME_PATTERN.match(block["title"] or "")
+        if block["kind"] == "it" and title_match and int(title_match.group(1)) in test_numbers \
+                and block["end"] is not None:
+            # the indentation before the block, the newline after it and the blank line between tests go as well
+            start = content.rfind("\n", 0, block["start"]) + 1
+            end = block["end"] + 1 if content.startswith("\n", block["end"]) else block["end"]
+            blank_line = BLANK_LINE_PATTERN.match(content, end)
+            if blank_line:
+                end = blank_line.end()
+            if content[start:block["start"]].strip():
+                start = block["start"]
+            cuts.append((start, end))
+
+    kept = []
+    position = 0
+    for start, end in cuts:
+        kept.append(content[position:start])
+        position = end
+    kept.append(content[position:])
+    return "".join(kept)
+
+
+def minimize_test_file(test_file: Path, pool, work_dir: Path, output_path: Path = None,
+                       weighted: bool = False, budget_ms: float = None, suite_coverage: dict = None,
+                       index: dict = None) -> dict:
+    """
+    Keep the smallest set of passing tests that covers every statement, branch and line the passing tests of the
+    file cover, the others are removed. Failing tests are removed too, they'd be skipped anyway.
+    :param output_path: where the minimized file is written, the test file itself when None
+    :param weighted: weigh the tests by their duration, so the cover is cheap to run instead of small
+    :param budget_ms: keep the suite of the Pareto front of coverage, runtime and size with the most coverage that
+                      runs within this many ms instead of the full cover (see pareto_selection.py)
+    :param suite_coverage: per-test coverage of earlier runs with its index, see cached_test_coverage
+    :return: the kept and removed test numbers, and the Pareto front when there is a budget
+    """
+    if suite_coverage is None:
+        per_test = collect_test_coverage(test_file, pool, work_dir)
+    else:
+        per_test = cached_test_coverage(test_file, pool, work_dir, suite_coverage, index)
+    passing = {test_number: test for test_number, test in per_test.items() if test["state"] == "passed"}
+
+    front = None
+    if budget_ms is not None:
+        front = pareto_front(candidate_suites(passing, greedy_set_cover))
+        kept = set(select_within_budget(front, budget_ms)["tests"])
+    else:
+        weights = {test_number: test["duration"] + 1 for test_number, test in passing.items()} if weighted else None
+        kept = set(greedy_set_cover({test_number: test["bits"] for test_number, test in passing.items()}, weights))
+
+    removed = sorted(set(per_test) - kept)
+    content = test_file.read_text(encoding="utf-8")
+    write_atomic(output_path or test_file, remove_tests(content, set(removed)))
+    minimized = {"kept": sorted(kept), "removed": removed}
+    if front is not None:
+        minimized["front"] = [{key: value for key, value in suite.items() if key != "tests"} for suite in front]
+    return minimized
+
+
+def minimize_suite(test_dir: Path, workers=None, weighted: bool = False, budget_ms: float = None,
+                   coverage_path: Path = None) -> dict:
+    """
+    Minimize every test file of test_dir in place, see minimize_test_file.
+    :param budget_ms: runtime budget per test file (contract)
+    :param coverage_path: bitsets file with the per-test coverage of the tests of this generation, the tests in it
+                          aren't run again and the ones that ran are added to it (see load_suite_coverage)
+    :return: the kept and removed tests per file
+    """
+    work_dir = test_dir / "minimization"
+    suite_coverage, index = load_suite_coverage(coverage_path) if coverage_path is not None else (None, None)
+    pool = start_worker_pool(workers)
+    try:
+        minimized = {}
+        for test_file in sorted(test_dir.glob("*.js")):
+            minimized[test_file.name] = minimize_test_file(test_file, pool, work_dir, weighted=weighted,
+                                                           budget_ms=budget_ms, suite_coverage=suite_coverage,
+                                                           index=index)
+            print(f"LOGGER: {test_file.name}: kept {len(minimized[test_file.name]['kept'])} tests, "
+                  f"removed {len(minimized[test_file.name]['removed'])}")
+        return minimized
+    finally:
+        stop_worker_pool(pool)
+        shutil.rmtree(work_dir, ignore_errors=True)
+        if coverage_path is not None:
+            save_suite_coverage(coverage_path, suite_coverage, index)
+
+
+TEST_DIR = HARDHAT_DIR / "test/genetic_search/success_generation1"
+NUM_WORKERS = None  # None uses all cores
+WEIGHTED = False
+RUNTIME_BUDGET_MS = None  # e.g. 30000: the best coverage within 30 seconds per contract
+
+if __name__ == "__main__":
+    minimize_suite(TEST_DIR, workers=NUM_WORKERS, weighted=WEIGHTED, budget_ms=RUNTIME_BUDGET_MS)
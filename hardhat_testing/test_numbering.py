@@ -0,0 +1,67 @@
+import json
+import threading
+from pathlib import Path
+
+
+def new_numbering(run_id: str = "run") -> dict:
+    """
+    Numbering of the amplified tests of one run. Every test file (scope) counts on its own, so the number a test gets
+    only depends on its own file and not on which files were amplified before it or at the same time.
+    :param run_id: name of the run, it is recorded in the manifest. The run, the test file and the test name stay
+                   the same over runs with the same run id and seed, together they identify a test
+    :return: dict that is passed to number_test, it can be shared by threads
+    """
+    return {"run": run_id, "lock": threading.Lock(), "next": {}, "manifest": {}, "mutations": {}}
+
+
+def number_test(numbering: dict, scope: str, origin=None, mutation=None) -> str:
+    """
+    Hand out the next test name of a test file.
+    :param scope: name of the test file the test is written to, every scope starts at 'test 1'
+    :param origin: original test the test is derived from, e.g. 'original 2', it is recorded in the manifest
+    :param mutation: category of the mutation the test was made with, it is recorded in the manifest
+    :return: test name, 'test N'
+    """
+    with numbering["lock"]:
+        number = numbering["next"].get(scope, 0) + 1
+        numbering["next"][scope] = number
+        test_name = f"test {number}"
+        if origin is not None:
+            numbering["manifest"].setdefault(scope, {}).setdefault(origin, []).append(test_name)
+        if mutation is not None:
+            numbering["mutations"].setdefault(scope, {})[test_name] = mutation
+    return test_name
+
+
+def get_manifest(numbering: dict) -> dict:
+    """
+    Copy of the manifest: per test file, the tests that were derived from every original test and the mutation
+    category of the mutants.
+    """
+    with numbering["lock"]:
+        return {"run": numbering["run"],
+                "files": {scope: {origin: list(test_names) for origin, test_names in origins.items()}
+                          for scope, origins in numbering["manifest"].items()},
+                "mutations": {scope: dict(tests) for scope, tests in numbering["mutations"].items()}}
+
+
+def merge_manifests(run_id: str, manifests: list) -> dict:
+    """Combine the manifests of several workers, the test files of the workers never overlap."""
+    files = {}
+    mutations = {}
+    for manifest in manifests:
+        files.update(manifest["files"])
+        mutations.update(manifest.get("mutations", {}))
+    return {"run": run_id, "files": dict(sorted(files.items())), "mutations": dict(sorted(mutations.items()))}
+
+
+def write_manifest(manifest: dict, path: Path):
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    tmp_path.replace(path)
+
+
+def load_manifest(path: Path) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,53 @@
+import json
+import re
+from pathlib import Path
+
+HARDHAT_DIR = Path(__file__).parent
+# written by mocha_results_reporter.js in the folder Hardhat runs in
+RESULTS_FILE = "mocha_results.json"
+TEST_NAME_PATTERN = re.compile(r'^test (\d+)$')
+
+
+def clear_test_results(run_dir: Path = HARDHAT_DIR):
+    """Remove the results of the previous run, so results of a run that crashed are never mistaken for new ones."""
+    (run_dir / RESULTS_FILE).unlink(missing_ok=True)
+
+
+def load_test_results(run_dir: Path = HARDHAT_DIR):
+    """
+    Result of every test of the last Hardhat run in run_dir.
+    :return: list of dicts with the file (relative to run_dir), title (the test id, 'test 12'), full title, state
+             ('passed', 'failed' or 'pending'), duration in ms and error message. None if the run didn't finish
+    """
+    results_path = run_dir / RESULTS_FILE
+    if not results_path.exists():
+        return None
+    with open(results_path, "r", encoding="utf-8") as f:
+        return json.load(f)["results"]
+
+
+def failing_tests_by_file(results: list, test_dir: str = None) -> dict:
+    """
+    Failing test numbers per test file name, the input of disable_tests_same_folder. Every file that ran is in it,
+    also the ones without failures. Works on the results of the reporter and of the test workers
+    (hardhat_worker_pool.run_tests). Failing hooks are not tests, they are left out.
+    :param test_dir: key the files by their path relative to this folder of the run instead ('generation1/x.js'),
+                     for runs with files of the same name in different subfolders
+    """
+    failing_tests = {}
+    for result in results:
+        if result["file"] is None:
+            continue
+        file_key = Path(result["file"]).relative_to(test_dir).as_posix() if test_dir else Path(result["file"]).name
+        failing = failing_tests.setdefault(file_key, [])
+        test_name_match = TEST_NAME_PATTERN.match(result["title"])
+        if result["state"] == "failed" and test_name_match:
+            failing.append(int(test_name_match.group(1)))
+    return failing_tests
+
+
+def count_states(results: list) -> dict:
+    counts = {"passed": 0, "failed": 0, "pending": 0}
+    for result in results:
+        counts[result["state"]] = counts.get(result["state"], 0) + 1
+    return counts
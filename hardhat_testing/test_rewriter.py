@@ -0,0 +1,134 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from test_numbering import write_manifest
+
+# `it("test 12"` or `it('test 12'`, one pattern for all tests of a file, the number is looked up in a set
+SKIP_PATTERN = re.compile(r'\bit\(["\']test (\d+)["\']')
+# it("some description", or it('some description', see rename_tests.py
+RENAME_PATTERN = re.compile(r'it\((["\'])(.*?)(\1)')
+
+
+def skip_tests(content: str, test_numbers) -> tuple:
+    """
+    Skip the tests in a single pass over the content, `it("test 12"` becomes `it.skip("test 12"`.
+    :return: new content and the test numbers that were skipped, in the order of the file
+    """
+    test_numbers = set(test_numbers)
+    skipped = []
+
+    def skip(match):
+        if int(match.group(1)) not in test_numbers:
+            return match.group()
+        skipped.append(int(match.group(1)))
+        return f'it.skip("test {match.group(1)}"'
+
+    if not test_numbers:
+        return content, skipped
+    return SKIP_PATTERN.sub(skip, content), skipped
+
+
+def rename_tests(content: str, first_number: int) -> tuple:
+    """
+    Rename every test to 'test N', numbered from first_number in the order of the file.
+    :return: new content and the new test names
+    """
+    names = []
+
+    def rename(match):
+        names.append(f"test {first_number + len(names)}")
+        return f'it("{names[-1]}"'
+
+    return RENAME_PATTERN.sub(rename, content), names
+
+
+def write_atomic(path: Path, content: str):
+    """Write next to the file and rename, a crash never leaves a half written test file behind."""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        file.write(content)
+    os.replace(tmp_path, path)
+
+
+def rewrite_file(source: Path, destination: Path, rewrite) -> dict:
+    """
+    Apply rewrite(content) -> (new content, changes) to one file. The file is only written when the destination is
+    another file or the content changed. rewrite returns None for the content when the file must not be written.
+    :return: manifest entry of the file
+    """
+    with open(source, "r", encoding="utf-8") as file:
+        content = file.read()
+    new_content, changes = rewrite(content)
+
+    written = new_content is not None and (destination != source or new_content != content)
+    if written:
+        write_atomic(destination, new_content)
+    return {"source": str(source), "destination": str(destination), "written": written, "changes": changes}
+
+
+def rewrite_files(jobs: list, workers=None) -> dict:
+    """
+    Rewrite files concurrently, every file is read, rewritten and written once.
+    :param jobs: list of (source, destination, rewrite), see rewrite_file
+    :param workers: number of threads, None uses the default of ThreadPoolExecutor
+    :return: manifest, the entry of every file by its name
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        entries = list(executor.map(lambda job: rewrite_file(*job), jobs))
+    return {"files": {Path(entry["source"]).name: entry for entry in entries}}
+
+
+def skip_failing_tests(failing_tests: dict, source_dir: Path, destination_dir: Path = None, workers=None,
+                       manifest_path: Path = None) -> dict:
+    """
+    Skip the failing tests of the files of source_dir and write them to destination_dir (in place when None).
+    Files without tests (no `it("test`) are not written.
+    :param failing_tests: failing test numbers per file name, see test_results.failing_tests_by_file
+    :param manifest_path: where to write the manifest of the skipped tests per file, not written when None
+    :return: manifest, the skipped tests of every file are its changes
+    """
+    destination_dir = source_dir if destination_dir is None else destination_dir
+
+    def skip_job(test_numbers):
+        def rewrite(content):
+            # failsafe if test is empty
+            if 'it("test' not in content:
+                return None, []
+            return skip_tests(content, test_numbers)
+        return rewrite
+
+    jobs = [(source_dir / name, destination_dir / name, skip_job(test_numbers))
+            for name, test_numbers in sorted(failing_tests.items())]
+    manifest = rewrite_files(jobs, workers)
+    if manifest_path is not None:
+        write_manifest(manifest, manifest_path)
+    return manifest
+
+
+def rename_all_tests(test_dir: Path, workers=None, manifest_path: Path = None) -> dict:
+    """
+    Number the tests of all .js files of test_dir 'test 1', 'test 2', ... over all files in the order of their
+    names. The tests of every file are counted first, so the files can be renamed concurrently and still get the
+    numbers they get when renamed one after the other.
+    :return: manifest, the new test names of every file are its changes
+    """
+    test_files = sorted(path for path in test_dir.iterdir() if path.name.endswith(".js"))
+
+    def count_tests(path):
+        with open(path, "r", encoding="utf-8") as file:
+            return len(RENAME_PATTERN.findall(file.read()))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        counts = list(executor.map(count_tests, test_files))
+
+    jobs = []
+    first_number = 1
+    for path, count in zip(test_files, counts):
+        jobs.append((path, path, lambda content, first=first_number: rename_tests(content, first)))
+        first_number += count
+    manifest = rewrite_files(jobs, workers)
+    if manifest_path is not None:
+        write_manifest(manifest, manifest_path)
+    return manifest
@@ -0,0 +1,218 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+from disable_failed_tests_script import disable_tests_same_folder
+from hardhat_worker_pool import start_worker_pool, run_on_pool, stop_worker_pool
+from parallel_amplifier import parallel_amplification
+from test_results import failing_tests_by_file
+
+HARDHAT_DIR = Path(__file__).parent
+BENCH_DIR = HARDHAT_DIR.parent / "Datasets/Test_Bench1/test"
+BENCHMARK_DIR = HARDHAT_DIR / "throughput_benchmark"
+# results and coverage of every evaluated test file of a real run, keyed by the hash of the file content
+RECORDING_PATH = HARDHAT_DIR / "throughput_recording.json"
+RESULTS_PATH = HARDHAT_DIR / "throughput_benchmark.json"
+
+# fixed subset of the bench, so runs can be compared
+BENCH_TESTS = ["2018-10299-test", "2018-10376-test", "2018-10468-test", "2018-10666-test", "2018-10705-test",
+               "2018-10706-test", "2018-11239-test", "2018-11335-test"]
+SEEDS = [0, 1, 2]
+NUM_GENERATIONS = 2
+
+
+def file_key(test_file: Path) -> str:
+    return hashlib.sha256(test_file.read_bytes()).hexdigest()
+
+
+def cpu_time() -> float:
+    """CPU seconds of this process and its finished children (the amplification workers), 0 for children on Windows."""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def hardhat_evaluator(pool):
+    """Evaluate test files on Hardhat workers, one file per request so every file gets its own coverage."""
+    def evaluate(test_files: list) -> list:
+        return run_on_pool(pool, [[test_file] for test_file in test_files])
+    return evaluate
+
+
+def recording_evaluator(evaluate, recording: dict):
+    """Evaluate with evaluate and store the evaluation of every file in recording, see replay_evaluator."""
+    def record(test_files: list) -> list:
+        evaluations = evaluate(test_files)
+        for test_file, evaluation in zip(test_files, evaluations):
+            recording[file_key(test_file)] = evaluation
+        return evaluations
+    return record
+
+
+def replay_evaluator(recording: dict, misses: list):
+    """
+    Local stand-in for Hardhat: the recorded evaluation of a file with the same content. The amplification is
+    deterministic for a seed, so a recorded run replays completely. Files that are not in the recording (the
+    amplifier changed) count as passing without coverage and are added to misses.
+    """
+    def replay(test_files: list) -> list:
+        evaluations = []
+        for test_file in test_files:
+            evaluation = recording.get(file_key(test_file))
+            if evaluation is None:
+                misses.append(str(test_file))
+                evaluation = {"failures": 0, "results": [], "coverage": {}}
+            # the results point to the file of this run
+            evaluations.append({**evaluation, "results": [{**result, "file": str(test_file)}
+                                                          for result in evaluation["results"]]})
+        return evaluations
+    return replay
+
+
+def covered_statements(evaluations: list) -> set:
+    """(contract, statement) of every statement that was hit in one of the evaluations."""
+    covered = set()
+    for evaluation in evaluations:
+        for coverage_key, metrics in evaluation["coverage"].items():
+            contract = os.path.basename(coverage_key)
+            covered.update((contract, statement) for statement, hits in metrics.get("s", {}).items() if hits > 0)
+    return covered
+
+
+def count_tests(test_files: list) -> int:
+    return sum(test_file.read_text(encoding="utf-8").count('it("test ') for test_file in test_files)
+
+
+def prepare_input(work_dir: Path, bench_tests: list = BENCH_TESTS) -> Path:
+    input_dir = work_dir / "input"
+    if work_dir.exists():
+        shutil.rmtree(work_dir)
+    input_dir.mkdir(parents=True)
+    for test_name in bench_tests:
+        shutil.copy(BENCH_DIR / f"{test_name}.js", input_dir / f"{test_name}.js")
+    return input_dir
+
+
+def run_cycle(amplifier_name: str, seed: int, evaluate, work_dir: Path, generations: int = NUM_GENERATIONS,
+              workers=None) -> dict:
+    """
+    One full amplification cycle on the bench subset: the genetic search for a number of generations (amplify,
+    evaluate, skip the failing tests, continue on the survivors) or a single random search.
+    :param evaluate: function(test files) -> evaluation per file, see hardhat_evaluator and replay_evaluator
+    :return: counts and timings of the cycle
+    """
+    input_dir = prepare_input(work_dir)
+    stats = {"amplifier": amplifier_name, "seed": seed, "tests_generated": 0, "evaluations": 0,
+             "amplification_s": 0.0, "evaluation_s": 0.0, "hardhat_test_s": 0.0}
+
+    # coverage of the original tests, the gain is measured against it
+    original_evaluations = evaluate(sorted(input_dir.glob("*.js")))
+    covered = covered_statements(original_evaluations)
+    stats["original_statements"] = len(covered)
+
+    cpu_start = cpu_time()
+    wall_start = time.perf_counter()
+    for generation in range(1, (generations if amplifier_name == "genetic" else 1) + 1):
+        output_dir = work_dir / f"generation{generation}"
+        start = time.perf_counter()
+        parallel_amplification(amplifier_name, input_dir, output_dir, seed=seed + generation, workers=workers)
+        stats["amplification_s"] += time.perf_counter() - start
+        # random search writes a folder per test
+        test_files = sorted(output_dir.rglob("*.js"))
+        stats["tests_generated"] += count_tests(test_files)
+
+        start = time.perf_counter()
+        evaluations = evaluate(test_files)
+        stats["evaluation_s"] += time.perf_counter() - start
+        results = [result for evaluation in evaluations for result in evaluation["results"]]
+        stats["evaluations"] += len(results)
+        stats["hardhat_test_s"] += sum(result["duration"] or 0 for result in results) / 1000
+        covered |= covered_statements(evaluations)
+
+        if amplifier_name == "genetic":
+            success_dir = work_dir / f"success_generation{generation}"
+            success_dir.mkdir()
+            disable_tests_same_folder(failing_tests_by_file(results), str(success_dir), str(output_dir))
+            input_dir = success_dir
+
+    stats["wall_s"] = time.perf_counter() - wall_start
+    stats["cpu_s"] = cpu_time() - cpu_start
+    stats["statements_gained"] = len(covered) - stats["original_statements"]
+    return stats
+
+
+def throughput(stats: dict) -> dict:
+    """
+    The numbers capacity is planned on. With the stand-in the evaluations are lookups and the CPU time doesn't
+    include Hardhat, so the evaluations per second of test time Hardhat recorded are reported as well.
+    """
+    def per_second(count, seconds):
+        return count / seconds if seconds > 0 else None
+
+    return {
+        "tests_generated_per_s": per_second(stats["tests_generated"], stats["amplification_s"]),
+        "evaluations_per_s": per_second(stats["evaluations"], stats["evaluation_s"]),
+        "evaluations_per_hardhat_s": per_second(stats["evaluations"], stats["hardhat_test_s"]),
+        "statements_gained_per_cpu_min": per_second(stats["statements_gained"], stats["cpu_s"] / 60),
+    }
+
+
+def run_benchmark(amplifier_names: list, mode: str = "replay", seeds=SEEDS, workers=None) -> list:
+    """
+    :param mode: 'replay' evaluates with the recording, 'record' runs Hardhat and records the evaluations,
+                 'hardhat' runs Hardhat without recording
+    :return: stats and throughput of every cycle, empty when there is no recording to replay
+    """
+    recording = {}
+    if mode == "replay":
+        if not RECORDING_PATH.exists():
+            print(f"LOGGER: no recording at {RECORDING_PATH}, run once with MODE = 'record' (it needs Hardhat) "
+                  f"before replaying")
+            return []
+        with open(RECORDING_PATH, "r", encoding="utf-8") as f:
+            recording = json.load(f)
+
+    pool = None
+    misses = []
+    if mode == "replay":
+        evaluate = replay_evaluator(recording, misses)
+    else:
+        pool = start_worker_pool(workers)
+        evaluate = hardhat_evaluator(pool)
+        if mode == "record":
+            evaluate = recording_evaluator(evaluate, recording)
+
+    all_stats = []
+    try:
+        for amplifier_name in amplifier_names:
+            for seed in seeds:
+                stats = run_cycle(amplifier_name, seed, evaluate, BENCHMARK_DIR / f"{amplifier_name}-{seed}",
+                                  workers=workers)
+                stats.update(throughput(stats))
+                all_stats.append(stats)
+                print(f"LOGGER: {amplifier_name} seed {seed}: {stats['tests_generated_per_s']:.1f} tests/s, "
+                      f"{stats['evaluations_per_s'] or 0:.1f} evaluations/s, "
+                      f"{stats['statements_gained_per_cpu_min'] or 0:.1f} statements gained/CPU-min")
+    finally:
+        if pool is not None:
+            stop_worker_pool(pool)
+
+    if mode == "record":
+        tmp_path = RECORDING_PATH.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(recording), encoding="utf-8")
+        tmp_path.replace(RECORDING_PATH)
+    if misses:
+        print(f"LOGGER: {len(misses)} evaluated files were not recorded, record again after changing the amplifier")
+    return all_stats
+
+
+MODE = "record"  # 'record' once with Hardhat, then 'replay' without it
+AMPLIFIERS_TO_RUN = ["random", "genetic"]
+NUM_WORKERS = None  # None uses all cores
+
+if __name__ == "__main__":
+    benchmark_stats = run_benchmark(AMPLIFIERS_TO_RUN, mode=MODE, workers=NUM_WORKERS)
+    if benchmark_stats:
+        RESULTS_PATH.write_text(json.dumps(benchmark_stats, indent=2), encoding="utf-8")